@@ -0,0 +1,198 @@
+# ABOUTME: Benchmark suite timing the spriter CLI over deterministic lavfi-generated test clips
+# ABOUTME: Writes comparable JSON results and checks them against a saved baseline
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import product
+from pathlib import Path
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+SCHEMA_VERSION = 1
+PRESETS = ('game', 'web', 'hires')
+
+# Deterministic synthetic sources: same arguments, same pixels on every machine
+CLIPS = [
+    {'name': 'testsrc2-480p-h264', 'source': 'testsrc2', 'size': '854x480', 'rate': 30, 'duration': 10, 'codec': 'libx264'},
+    {'name': 'testsrc2-1080p-h264', 'source': 'testsrc2', 'size': '1920x1080', 'rate': 30, 'duration': 10, 'codec': 'libx264'},
+    {'name': 'testsrc2-720p-mpeg4-long', 'source': 'testsrc2', 'size': '1280x720', 'rate': 25, 'duration': 60, 'codec': 'mpeg4'},
+    {'name': 'mandelbrot-720p-h264', 'source': 'mandelbrot', 'size': '1280x720', 'rate': 30, 'duration': 10, 'codec': 'libx264'},
+    {'name': 'mandelbrot-360p-mpeg4', 'source': 'mandelbrot', 'size': '640x360', 'rate': 24, 'duration': 20, 'codec': 'mpeg4'},
+]
+QUICK_CLIPS = ('testsrc2-480p-h264', 'mandelbrot-360p-mpeg4')
+
+
+def clip_filename(clip):
+    return f"{clip['name']}.mp4"
+
+
+def generate_clip(clip, clip_dir):
+    """Render a clip with ffmpeg's lavfi sources unless it already exists. Returns its path."""
+    path = clip_dir / clip_filename(clip)
+    if path.exists():
+        return path
+
+    source = f"{clip['source']}=size={clip['size']}:rate={clip['rate']}"
+    codec = ['-c:v', clip['codec']]
+    if clip['codec'] == 'libx264':
+        # Fixed preset and GOP so seek costs are comparable between machines
+        codec += ['-preset', 'medium', '-g', str(clip['rate'] * 2)]
+    cmd = [
+        'ffmpeg', '-v', 'error',
+        '-f', 'lavfi', '-i', source,
+        '-t', str(clip['duration']),
+        *codec, '-pix_fmt', 'yuv420p',
+        '-fflags', '+bitexact', '-flags:v', '+bitexact', '-map_metadata', '-1',
+        '-y', str(path)
+    ]
+    subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return path
+
+
+def scenarios(presets):
+    """Every preset with and without --loop and --create-gif."""
+    for preset, loop, create_gif in product(presets, (False, True), (False, True)):
+        yield {'preset': preset, 'loop': loop, 'create_gif': create_gif}
+
+
+def scenario_key(result):
+    return (result['clip'], result['preset'], result['loop'], result['create_gif'])
+
+
+def time_scenario(clip_path, scenario, repeat, work_dir):
+    """Run the spriter CLI repeat times for one scenario and return wall times plus a profile.
+
+    The timed runs don't pass --profile-json, so profiling can't skew them;
+    the profile comes from one extra, untimed run.
+    """
+    output = work_dir / 'sheet.png'
+    profile_path = work_dir / 'profile.json'
+    cmd = [sys.executable, '-m', 'spriter.main', str(clip_path), '--preset', scenario['preset'],
+           '--output', str(output), '--no-cache']
+    if scenario['loop']:
+        cmd.append('--loop')
+    if scenario['create_gif']:
+        cmd.append('--create-gif')
+
+    # Keep the probe cache out of the user's home directory
+    env = dict(os.environ, SPRITER_CACHE_DIR=str(work_dir / 'cache'))
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, capture_output=True, text=True, check=True, env=env)
+        runs.append(time.perf_counter() - start)
+
+    subprocess.run(cmd + ['--profile-json', str(profile_path)], capture_output=True, text=True, check=True, env=env)
+    profile = json.loads(profile_path.read_text()) if profile_path.exists() else None
+    return runs, profile
+
+
+def environment():
+    """Machine and tool versions recorded alongside the results."""
+    try:
+        ffmpeg = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, check=True).stdout.splitlines()[0]
+    except (subprocess.CalledProcessError, FileNotFoundError, IndexError):
+        ffmpeg = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg
+    }
+
+
+def compare(results, baseline, threshold):
+    """Pair results with baseline entries. Returns rows of (result, baseline_median, ratio, regressed)."""
+    baseline_medians = {scenario_key(entry): entry['median_seconds'] for entry in baseline['results']}
+    rows = []
+    for result in results:
+        base = baseline_medians.get(scenario_key(result))
+        ratio = result['median_seconds'] / base if base else None
+        rows.append((result, base, ratio, ratio is not None and ratio > 1 + threshold))
+    return rows
+
+
+def results_table(rows):
+    table = Table(title='Spriter benchmarks')
+    for column in ('Clip', 'Preset', 'Loop', 'GIF', 'Median (s)', 'Min (s)', 'Baseline (s)', 'Change'):
+        table.add_column(column, justify='right' if '(' in column or column == 'Change' else 'left')
+    for result, base, ratio, regressed in rows:
+        if ratio is None:
+            change = '[dim]n/a[/dim]'
+        else:
+            style = 'red' if regressed else ('green' if ratio < 1 else 'dim')
+            change = f'[{style}]{ratio - 1:+.1%}[/{style}]'
+        table.add_row(
+            result['clip'], result['preset'], '✓' if result['loop'] else '', '✓' if result['create_gif'] else '',
+            f"{result['median_seconds']:.3f}", f"{result['min_seconds']:.3f}",
+            f'{base:.3f}' if base else '', change
+        )
+    return table
+
+
+@click.command()
+@click.option('--output', '-o', type=click.Path(dir_okay=False, path_type=Path), default='bench_results.json', show_default=True, help='Where to write the JSON results')
+@click.option('--baseline', '-b', type=click.Path(exists=True, dir_okay=False, path_type=Path), help='Earlier results to compare against')
+@click.option('--threshold', default=0.10, show_default=True, help='Fail when a scenario is slower than the baseline by more than this fraction')
+@click.option('--repeat', '-r', default=3, type=click.IntRange(min=1), show_default=True, help='Timed runs per scenario (the median is compared)')
+@click.option('--clip', 'clip_names', multiple=True, type=click.Choice([clip['name'] for clip in CLIPS]), help='Only benchmark these clips (repeatable)')
+@click.option('--preset', 'presets', multiple=True, type=click.Choice(PRESETS), help='Only benchmark these presets (repeatable)')
+@click.option('--quick', is_flag=True, help='Two small clips and one run each, for a fast smoke check')
+@click.option('--clip-dir', type=click.Path(file_okay=False, path_type=Path), default=Path(__file__).parent / '.clips', show_default=True, help='Where generated test clips are kept between runs')
+def main(output, baseline, threshold, repeat, clip_names, presets, quick, clip_dir):
+    """Time the spriter pipeline over synthetic clips and compare with a baseline."""
+    console = Console()
+    if clip_names:
+        clips = [clip for clip in CLIPS if clip['name'] in clip_names]
+    elif quick:
+        clips = [clip for clip in CLIPS if clip['name'] in QUICK_CLIPS]
+    else:
+        clips = CLIPS
+    if quick:
+        repeat = 1
+    presets = presets or PRESETS
+
+    clip_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        work_dir = Path(tmpdir)
+        for clip in clips:
+            console.print(f"[cyan]Preparing {clip['name']}...[/cyan]")
+            clip_path = generate_clip(clip, clip_dir)
+            for scenario in scenarios(presets):
+                runs, profile = time_scenario(clip_path, scenario, repeat, work_dir)
+                results.append({
+                    'clip': clip['name'],
+                    **scenario,
+                    'runs': [round(run, 6) for run in runs],
+                    'median_seconds': round(statistics.median(runs), 6),
+                    'min_seconds': round(min(runs), 6),
+                    'profile': profile
+                })
+                console.print(f"[dim]  {scenario['preset']:<5} loop={scenario['loop']!s:<5} gif={scenario['create_gif']!s:<5} "
+                              f"{statistics.median(runs):.3f}s[/dim]")
+
+    report = {'schema': SCHEMA_VERSION, 'environment': environment(), 'clips': clips, 'results': results}
+    output.write_text(json.dumps(report, indent=2))
+
+    rows = compare(results, json.loads(baseline.read_text()), threshold) if baseline else [(result, None, None, False) for result in results]
+    console.print(results_table(rows))
+    console.print(f"[green]✓ Results written to {output}[/green]")
+
+    regressions = [row for row in rows if row[3]]
+    if regressions:
+        console.print(f"[red]{len(regressions)} scenario(s) slower than the baseline by more than {threshold:.0%}[/red]")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
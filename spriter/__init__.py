@@ -1,2 +1,7 @@
 # ABOUTME: Package initialization for spriter video to sprite sheet converter
-# ABOUTME: Exports the main function for CLI usage
\ No newline at end of file
+# ABOUTME: Exports the in-process library API (sync and asyncio); the CLI lives in spriter.main
+
+from spriter.aio import build_sheet_async
+from spriter.api import SheetFrame, SheetResult, build_sheet
+
+__all__ = ['SheetFrame', 'SheetResult', 'build_sheet', 'build_sheet_async']
@@ -0,0 +1,198 @@
+# ABOUTME: asyncio execution layer for ffmpeg/ffprobe so many sheet builds can share one event loop
+# ABOUTME: Every child process is killed and reaped when its job times out or is cancelled
+
+import asyncio
+import io
+import os
+import subprocess
+import time
+
+from PIL import Image
+
+from spriter.api import blank_sheet_array, check_options, sheet_result
+from spriter.pages import sample_window, tile_frame_count, tile_sheet_command
+from spriter.probe import cached_probe, parse_probe_output, probe_command, store_probe
+from spriter.rawpipe import assemble_sheets, build_raw_command
+from spriter.sampling import build_seek_command, sample_timestamps, tile_frames
+
+
+async def _kill(process):
+    """Kill a child that is still running and wait for it so no zombie is left behind."""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+async def run_process(cmd, timeout=None):
+    """Run cmd and return its stdout bytes.
+
+    If the call times out (asyncio.TimeoutError) or the awaiting task is
+    cancelled, the child is killed before the exception propagates. A
+    non-zero exit raises subprocess.CalledProcessError with decoded stderr.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        await _kill(process)
+        raise
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr.decode(errors='replace'))
+    return stdout
+
+
+async def probe_video_async(input_file, count_frames=False, use_cache=True, timeout=None):
+    """Async probe_video: same command, same cache entries, same VideoInfo.
+
+    The SQLite cache can wait on a lock, so it is read and written on a
+    worker thread.
+    """
+    if use_cache:
+        cached = await asyncio.to_thread(cached_probe, input_file, count_frames)
+        if cached is not None:
+            return cached
+
+    stdout = await run_process(probe_command(input_file, count_frames), timeout)
+    info = parse_probe_output(stdout.decode())
+
+    if use_cache:
+        await asyncio.to_thread(store_probe, input_file, count_frames, info)
+    return info
+
+
+def _decode_png(png):
+    image = Image.open(io.BytesIO(png))
+    image.load()
+    return image
+
+
+def _assemble_raw_sheet(frames, grid, size, blank_size):
+    array, count = next(assemble_sheets(frames, grid, size), (None, 0))
+    if array is None:
+        array = blank_sheet_array(*blank_size)
+    return array, Image.fromarray(array), count
+
+
+async def _grab_frame(source, timestamp, size, exact, limit):
+    async with limit:
+        png = await run_process(build_seek_command(source, timestamp, size, exact))
+    if not png:
+        return None
+    return await asyncio.to_thread(_decode_png, png)
+
+
+async def _read_raw_frames(source, fps, size, window, count):
+    """Read up to count raw RGB frames, then stop ffmpeg.
+
+    Returns (frames, frames_read) where frames is a (count, height, width, 3)
+    array whose first frames_read entries are filled.
+    """
+    import numpy as np
+
+    width, height = map(int, size.split('x'))
+    frame_bytes = width * height * 3
+    cmd = build_raw_command(source, fps, size, window)
+    frames = np.empty((count, height, width, 3), dtype=np.uint8)
+    view = memoryview(frames).cast('B')
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    read = 0
+    try:
+        while read < count:
+            try:
+                chunk = await process.stdout.readexactly(frame_bytes)
+            except asyncio.IncompleteReadError:
+                break
+            view[read * frame_bytes:(read + 1) * frame_bytes] = chunk
+            read += 1
+    except BaseException:
+        await _kill(process)
+        raise
+    if read < count:
+        # ffmpeg ran out of input on its own; keep its real exit status
+        await process.wait()
+    else:
+        await _kill(process)
+    stderr = await process.stderr.read()
+
+    if read == 0 and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr.decode(errors='replace'))
+    return frames, read
+
+
+async def build_sheet_async(source, fps=10, size='64x64', grid='6x6', sampling='fps', backend='tile', use_cache=True,
+                            with_array=False, timeout=None, max_concurrency=None):
+    """Async build_sheet for services running many builds on one event loop.
+
+    Takes the same arguments and returns the same SheetResult as build_sheet.
+    timeout (seconds) bounds the whole job: when it expires, or when the
+    calling task is cancelled, every ffmpeg/ffprobe child of the job is killed
+    and asyncio.TimeoutError / CancelledError is raised. Seek sampling runs at
+    most max_concurrency seeks at once (default: one per CPU). PNG decoding
+    and encoding, tiling and probe cache access run on worker threads, so
+    one job's hires sheet or a locked cache doesn't stall the others.
+    """
+    frame_width, frame_height, grid_cols, grid_rows = check_options(size, grid, sampling, backend, with_array)
+    return await asyncio.wait_for(
+        _build_sheet(source, fps, size, grid, sampling, backend, use_cache, with_array, max_concurrency,
+                     (frame_width, frame_height), (grid_cols, grid_rows)),
+        timeout
+    )
+
+
+async def _build_sheet(source, fps, size, grid, sampling, backend, use_cache, with_array, max_concurrency,
+                       frame_size, grid_dims):
+    frame_width, frame_height = frame_size
+    grid_cols, grid_rows = grid_dims
+    timings = {}
+    total_start = time.perf_counter()
+    slots = grid_cols * grid_rows
+    window = sample_window(fps, grid)
+
+    start = time.perf_counter()
+    try:
+        video_info = await probe_video_async(source, use_cache=use_cache)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        if sampling != 'fps':
+            raise
+        video_info = None
+    timings['probe'] = time.perf_counter() - start
+    duration = video_info.duration if video_info else None
+
+    array = None
+    png = None
+    start = time.perf_counter()
+    if sampling != 'fps':
+        if not duration:
+            raise ValueError(f"could not determine the duration of {source} for seek sampling")
+        timestamps = sample_timestamps(duration, slots)
+        limit = asyncio.Semaphore(max_concurrency or os.cpu_count() or 1)
+        # TaskGroup cancels (and so kills) the remaining seeks as soon as one fails
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(_grab_frame(source, ts, size, sampling == 'seek-exact', limit))
+                for ts in timestamps
+            ]
+        sheet, placed = await asyncio.to_thread(tile_frames, [task.result() for task in tasks], grid, size)
+    elif backend == 'raw':
+        frames, count = await _read_raw_frames(source, fps, size, window, slots)
+        array, sheet, count = await asyncio.to_thread(_assemble_raw_sheet, frames[:count], grid, size,
+                                                      (grid_cols, grid_rows, frame_width, frame_height))
+        timestamps = [i / fps for i in range(slots)]
+        placed = range(count)
+    else:
+        png = await run_process(tile_sheet_command(source, fps, size, grid))
+        sheet = await asyncio.to_thread(_decode_png, png)
+        timestamps = [i / fps for i in range(slots)]
+        placed = range(tile_frame_count(fps, grid, duration=duration))
+    timings['decode'] = time.perf_counter() - start
+
+    return await asyncio.to_thread(sheet_result, sheet, png, array, with_array, grid_dims, frame_size, placed, timestamps,
+                                   video_info, timings, total_start)
@@ -0,0 +1,173 @@
+# ABOUTME: Importable library API for building sprite sheets in-process
+# ABOUTME: Returns PNG bytes (optionally a NumPy array), frame metadata and stage timings without console output
+
+import io
+import re
+import subprocess
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from PIL import Image
+
+from spriter.pages import sample_window, tile_frame_count, tile_sheet_command
+from spriter.probe import probe_video
+from spriter.rawpipe import NUMPY_AVAILABLE, assemble_sheets, iter_raw_frames
+from spriter.sampling import assemble_seek_sheet
+
+SAMPLING_MODES = ('fps', 'seek', 'seek-exact')
+BACKENDS = ('tile', 'raw')
+
+
+@dataclass(frozen=True)
+class SheetFrame:
+    """Where one sampled frame sits in the sheet and when it was taken from the source."""
+    index: int
+    x: int
+    y: int
+    width: int
+    height: int
+    timestamp: float
+
+
+@dataclass
+class SheetResult:
+    """An in-memory sprite sheet plus everything needed to use it without re-probing."""
+    image: bytes
+    width: int
+    height: int
+    grid: tuple[int, int]
+    frames: list[SheetFrame]
+    video_info: object = None
+    timings: dict[str, float] = field(default_factory=dict)
+    array: object = None
+
+    def save(self, path):
+        """Write the PNG bytes to path."""
+        Path(path).write_bytes(self.image)
+
+
+def parse_dimensions(value, name):
+    """Parse a 'WxH' string into two positive ints, raising ValueError otherwise."""
+    match = re.fullmatch(r'([1-9]\d*)x([1-9]\d*)', str(value))
+    if not match:
+        raise ValueError(f"{name} must look like WxH (e.g. 64x64), got {value!r}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def frame_layout(indices, timestamps, grid_cols, frame_width, frame_height):
+    """Build SheetFrame entries for the tile indices that hold a frame."""
+    frames = []
+    for index in indices:
+        row, col = divmod(index, grid_cols)
+        frames.append(SheetFrame(index, col * frame_width, row * frame_height, frame_width, frame_height,
+                                 round(timestamps[index], 3)))
+    return frames
+
+
+def check_options(size, grid, sampling, backend, with_array):
+    """Validate build_sheet arguments, returning (frame_width, frame_height, grid_cols, grid_rows)."""
+    frame_width, frame_height = parse_dimensions(size, 'size')
+    grid_cols, grid_rows = parse_dimensions(grid, 'grid')
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"sampling must be one of {', '.join(SAMPLING_MODES)}")
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {', '.join(BACKENDS)}")
+    if (backend == 'raw' or with_array) and not NUMPY_AVAILABLE:
+        raise ValueError("numpy is required for backend='raw' and with_array=True")
+    return frame_width, frame_height, grid_cols, grid_rows
+
+
+def blank_sheet_array(grid_cols, grid_rows, frame_width, frame_height):
+    """An all-black sheet array for when the raw backend produced no frames."""
+    import numpy as np
+    return np.zeros((grid_rows * frame_height, grid_cols * frame_width, 3), dtype=np.uint8)
+
+
+def sheet_result(sheet, png, array, with_array, grid, frame_size, placed, timestamps, video_info, timings,
+                 total_start):
+    """Encode the sheet if needed, record the encode/total timings and build the SheetResult."""
+    grid_cols, grid_rows = grid
+    frame_width, frame_height = frame_size
+    start = time.perf_counter()
+    if png is None:
+        buffer = io.BytesIO()
+        sheet.save(buffer, format='PNG')
+        png = buffer.getvalue()
+    if with_array and array is None:
+        import numpy as np
+        array = np.asarray(sheet.convert('RGB'))
+    timings['encode'] = time.perf_counter() - start
+    timings['total'] = time.perf_counter() - total_start
+
+    return SheetResult(
+        image=png,
+        width=sheet.width,
+        height=sheet.height,
+        grid=(grid_cols, grid_rows),
+        frames=frame_layout(placed, timestamps, grid_cols, frame_width, frame_height),
+        video_info=video_info,
+        timings=timings,
+        array=array
+    )
+
+
+def build_sheet(source, fps=10, size='64x64', grid='6x6', sampling='fps', backend='tile', use_cache=True,
+                with_array=False):
+    """Build a sprite sheet for source entirely in memory and return a SheetResult.
+
+    Nothing is printed and no files are written. sampling and backend mirror the
+    CLI's --sampling and --backend options. with_array=True also returns the
+    sheet as an (height, width, 3) uint8 NumPy array (requires numpy).
+    ffmpeg/ffprobe failures raise subprocess.CalledProcessError; invalid
+    arguments raise ValueError.
+    """
+    frame_width, frame_height, grid_cols, grid_rows = check_options(size, grid, sampling, backend, with_array)
+
+    timings = {}
+    total_start = time.perf_counter()
+    slots = grid_cols * grid_rows
+    # Same input-side cap as the CLI: enough source time to fill every tile
+    window = sample_window(fps, grid)
+
+    # Probe (usually a cache hit) for duration; seek sampling cannot work without it
+    start = time.perf_counter()
+    try:
+        video_info = probe_video(source, use_cache=use_cache)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        if sampling != 'fps':
+            raise
+        video_info = None
+    timings['probe'] = time.perf_counter() - start
+    duration = video_info.duration if video_info else None
+
+    array = None
+    start = time.perf_counter()
+    if sampling != 'fps':
+        if not duration:
+            raise ValueError(f"could not determine the duration of {source} for seek sampling")
+        sheet, timestamps, placed = assemble_seek_sheet(source, duration, size, grid, exact=(sampling == 'seek-exact'))
+        timings['decode'] = time.perf_counter() - start
+        png = None
+    elif backend == 'raw':
+        frames = iter_raw_frames(source, fps, size, window=window, max_frames=slots)
+        array, count = next(assemble_sheets(frames, grid, size), (None, 0))
+        if array is None:
+            array = blank_sheet_array(grid_cols, grid_rows, frame_width, frame_height)
+        timings['decode'] = time.perf_counter() - start
+        sheet = Image.fromarray(array)
+        timestamps = [i / fps for i in range(slots)]
+        placed = range(count)
+        png = None
+    else:
+        cmd = tile_sheet_command(source, fps, size, grid)
+        result = subprocess.run(cmd, capture_output=True, check=True)
+        timings['decode'] = time.perf_counter() - start
+        png = result.stdout
+        sheet = Image.open(io.BytesIO(png))
+        timestamps = [i / fps for i in range(slots)]
+        # The tile filter pads with blank tiles once the source runs out
+        placed = range(tile_frame_count(fps, grid, duration=duration))
+
+    return sheet_result(sheet, png, array, with_array, (grid_cols, grid_rows), (frame_width, frame_height),
+                        placed, timestamps, video_info, timings, total_start)
@@ -0,0 +1,232 @@
+# ABOUTME: Texture atlases: the frames of many clips packed onto shared fixed-size pages
+# ABOUTME: Shelf rectangle packer plus a JSON sidecar mapping each animation to its frame rects
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+
+try:
+    from PIL import Image, ImageChops
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+from spriter.metadata import frame_entry, sheet_metadata, write_metadata
+from spriter.pages import page_path, remove_pages
+from spriter.palette import shared_palette, to_indexed
+from spriter.profiling import Profiler
+from spriter.rawpipe import build_raw_command, fill_raw_frames
+
+
+def extract_clip_frames(input_file, fps, size, window=None, max_frames=None):
+    """Decode one clip once into a list of RGBA PIL images (fps-sampled, scaled to size).
+
+    Frames come through the raw-pipe decoder as RGBA, so sources with an
+    alpha channel keep it. Does not need NumPy.
+    """
+    width, height = map(int, size.split('x'))
+    buffer = bytearray(width * height * 4)
+    cmd = build_raw_command(input_file, fps, size, window, 'rgba')
+    return [Image.frombytes('RGBA', (width, height), bytes(buffer))
+            for _ in fill_raw_frames(cmd, memoryview(buffer), max_frames)]
+
+
+def trim_frame(frame, key_color=None, tolerance=16):
+    """Crop an RGBA frame to the bounding box of its visible content.
+
+    Without key_color, content is every pixel with non-zero alpha. With
+    key_color (an RGB tuple), pixels within tolerance of it on every channel
+    count as background and are made transparent first, so a green-screen
+    clip comes out keyed as well as trimmed.
+
+    Returns (trimmed, (left, top)): the cropped frame and where its top-left
+    corner sat in the original. A frame with no content becomes a single
+    transparent pixel at (0, 0).
+    """
+    if key_color is not None:
+        difference = ImageChops.difference(frame.convert('RGB'), Image.new('RGB', frame.size, key_color))
+        keep = reduce(ImageChops.lighter, difference.split()).point(lambda value: 255 if value > tolerance else 0)
+        frame = frame.copy()
+        frame.putalpha(ImageChops.multiply(frame.getchannel('A'), keep))
+
+    bbox = frame.getchannel('A').getbbox()
+    if bbox is None:
+        return Image.new('RGBA', (1, 1), (0, 0, 0, 0)), (0, 0)
+    return frame.crop(bbox), bbox[:2]
+
+
+def frame_hash(frame, method='exact'):
+    """Key under which duplicate frames collapse into one atlas tile.
+
+    exact hashes the RGBA pixels, so only bit-identical frames match.
+    perceptual is a 256-bit difference hash (dHash) of the frame composited
+    onto black and shrunk to 17x16 grayscale: each bit says whether a pixel
+    is brighter than its right-hand neighbour, so held poses that differ
+    only by compression noise still match. Frames of different sizes never
+    match.
+    """
+    if method == 'exact':
+        return frame.size, hashlib.blake2b(frame.tobytes(), digest_size=16).digest()
+    flattened = Image.alpha_composite(Image.new('RGBA', frame.size, (0, 0, 0, 255)), frame)
+    pixels = flattened.convert('L').resize((17, 16), Image.Resampling.BILINEAR).tobytes()
+    bits = 0
+    for row in range(16):
+        for column in range(16):
+            bits = (bits << 1) | (pixels[row * 17 + column] > pixels[row * 17 + column + 1])
+    return frame.size, bits
+
+
+def pack_shelves(rects, page_size, padding=0):
+    """Place (width, height) rects on fixed-size pages with a shelf packer.
+
+    Rects are placed tallest first, left to right along horizontal shelves;
+    a rect that doesn't fit on the current shelf starts a new one, and a
+    shelf that doesn't fit on the page starts a new page. The sort is
+    stable, so equal-height frames keep their order. padding pixels are
+    left between neighbouring rects.
+
+    Returns (placements, page_count) where placements[i] is the
+    (page, x, y) of rects[i]. Raises ValueError if a rect is larger than
+    a page.
+    """
+    page_width, page_height = page_size
+    placements = [None] * len(rects)
+    page = x = y = shelf_height = 0
+    for i in sorted(range(len(rects)), key=lambda i: -rects[i][1]):
+        width, height = rects[i]
+        if width > page_width or height > page_height:
+            raise ValueError(f"a {width}x{height} frame doesn't fit on a {page_width}x{page_height} atlas page")
+        if x + width > page_width:
+            x, y, shelf_height = 0, y + shelf_height + padding, 0
+        if y + height > page_height:
+            page, x, y, shelf_height = page + 1, 0, 0, 0
+        placements[i] = (page, x, y)
+        x += width + padding
+        shelf_height = max(shelf_height, height)
+    return placements, (page + 1 if rects else 0)
+
+
+def animation_names(video_files):
+    """Map each video file to a unique animation name: its stem, suffixed _2, _3, ... on clashes."""
+    names = {}
+    taken = set()
+    for video_file in video_files:
+        name = video_file.stem
+        suffix = 2
+        while name in taken:
+            name = f'{video_file.stem}_{suffix}'
+            suffix += 1
+        taken.add(name)
+        names[video_file] = name
+    return names
+
+
+def atlas_page_path(output_file, index, page_count):
+    """A single-page atlas is written to output_file itself, otherwise name_0.png, name_1.png, ..."""
+    return output_file if page_count == 1 else page_path(output_file, index)
+
+
+def build_atlas(video_files, output_file, fps, size, max_frames, window=None, page_size=(2048, 2048), padding=1, jobs=1,
+                trim=False, key_color=None, tolerance=16, dedup=None, metadata_formats=('json',), palette=0,
+                dither='floyd-steinberg', profiler=None):
+    """Extract every clip's frames once and pack them all into shared atlas pages.
+
+    Clips are decoded on up to jobs threads. Pages are RGBA PNGs with
+    transparent unused space, and a JSON sidecar next to output_file maps
+    each animation name to its source and the page rect of every frame.
+    With trim, frames are cropped to their content first (see trim_frame)
+    and only the trimmed rects are packed; every frame records its offset
+    within, and the size of, the untrimmed frame so it can be drawn back in
+    place. With dedup ('exact' or 'perceptual', see frame_hash), frames
+    with the same hash, within or across clips, are stored as one tile that
+    every duplicate's rect points at. Each frame's 'tile' is its index among
+    the unique tiles. With palette (a color count), every page is mapped onto
+    one palette built from all pages and written as an indexed PNG with
+    1-bit transparency. The generic JSON sidecar is always written;
+    metadata_formats can add TexturePacker documents per page. Clips that
+    fail to decode or yield no frames are left out.
+
+    Returns (pages, sidecar, failed): the written page paths, the sidecar
+    path and a {video_file: error} dict for the clips that were skipped.
+    """
+    profiler = profiler or Profiler()
+    names = animation_names(video_files)
+
+    def extract(video_file):
+        with profiler.stage('decode'):
+            frames = extract_clip_frames(video_file, fps, size, window, max_frames)
+        if trim:
+            with profiler.stage('trim'):
+                trimmed = [trim_frame(frame, key_color, tolerance) for frame in frames]
+            profiler.count('pixels trimmed', sum(frame.width * frame.height - cropped.width * cropped.height
+                                                 for frame, (cropped, _) in zip(frames, trimmed)))
+        else:
+            trimmed = [(frame, (0, 0)) for frame in frames]
+        if not dedup:
+            return [(frame, offset, None) for frame, offset in trimmed]
+        # Hash on the worker thread; duplicates are matched once all clips are in
+        with profiler.stage('dedup'):
+            return [(frame, offset, frame_hash(frame, dedup)) for frame, offset in trimmed]
+
+    clips = {}
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {video_file: executor.submit(extract, video_file) for video_file in video_files}
+        for video_file, future in futures.items():
+            try:
+                frames = future.result()
+            except Exception as e:
+                failed[video_file] = e
+                continue
+            if not frames:
+                failed[video_file] = ValueError('no frames decoded')
+                continue
+            clips[video_file] = frames
+            profiler.count('frames decoded', len(frames))
+
+    frames = [(video_file, frame, offset, key) for video_file, clip in clips.items() for frame, offset, key in clip]
+    tiles = []
+    frame_tiles = []
+    tile_index = {}
+    for _, frame, _, key in frames:
+        if key is None or key not in tile_index:
+            tiles.append(frame)
+            if key is not None:
+                tile_index[key] = len(tiles) - 1
+        frame_tiles.append(tile_index[key] if key is not None else len(tiles) - 1)
+    if dedup:
+        profiler.count('duplicate frames', len(frames) - len(tiles))
+
+    with profiler.stage('pack'):
+        placements, page_count = pack_shelves([tile.size for tile in tiles], page_size, padding)
+
+    pages = [Image.new('RGBA', page_size, (0, 0, 0, 0)) for _ in range(page_count)]
+    source_width, source_height = map(int, size.split('x'))
+    animations = {names[video_file]: {'source': str(video_file), 'frames': []} for video_file in clips}
+    with profiler.stage('atlas compose'):
+        for tile, (page, x, y) in zip(tiles, placements):
+            pages[page].paste(tile, (x, y))
+        for (video_file, frame, (offset_x, offset_y), _), tile in zip(frames, frame_tiles):
+            page, x, y = placements[tile]
+            animations[names[video_file]]['frames'].append(
+                frame_entry(page, x, y, frame.width, frame.height, (offset_x, offset_y), (source_width, source_height), tile=tile))
+
+    if palette and pages:
+        with profiler.stage('palette'):
+            colors = shared_palette(pages, palette, transparent=True)
+            pages = [to_indexed(page, colors, dither) for page in pages]
+
+    written = []
+    with profiler.stage('png write'):
+        remove_pages(output_file)
+        for index, page in enumerate(pages):
+            path = atlas_page_path(output_file, index, page_count)
+            page.save(path)
+            written.append(path)
+            profiler.count('bytes written', path.stat().st_size)
+
+    metadata = sheet_metadata([(path, page_size) for path in written], animations, fps, size,
+                              trimmed=trim, dedup=dedup, tile_count=len(tiles))
+    formats = ('json',) + tuple(metadata_format for metadata_format in metadata_formats if metadata_format != 'json')
+    sidecar = write_metadata(output_file, metadata, formats)[0]
+    return written, sidecar, failed
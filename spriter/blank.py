@@ -0,0 +1,76 @@
+# ABOUTME: Blank-frame detection for sprite sheet tiles
+# ABOUTME: Computes per-tile mean, max and variance for the whole sheet in one vectorized pass
+
+from dataclasses import dataclass
+
+from PIL import ImageStat
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class BlankThresholds:
+    """A tile is blank if its brightest value is at most max, or it is both dark (mean) and flat (variance)."""
+    mean: float = 10.0
+    max: float = 16.0
+    variance: float = 25.0
+
+
+def tile_stats(sheet, grid_cols, grid_rows):
+    """Return per-tile (mean, max, variance) arrays of shape (rows, cols) for a sheet image.
+
+    The sheet is converted once and reshaped to (rows, cols, h, w, c), so every
+    statistic is a single reduction over the whole grid. Mean and variance are
+    computed on per-pixel brightness (channel average); max is over all channels.
+    """
+    pixels = np.asarray(sheet.convert('RGB'))
+    frame_height = pixels.shape[0] // grid_rows
+    frame_width = pixels.shape[1] // grid_cols
+    pixels = pixels[:grid_rows * frame_height, :grid_cols * frame_width]
+
+    tiles = pixels.reshape(grid_rows, frame_height, grid_cols, frame_width, 3).swapaxes(1, 2)
+    brightness = tiles.mean(axis=-1, dtype=np.float32)
+    return brightness.mean(axis=(2, 3)), tiles.max(axis=(2, 3, 4)), brightness.var(axis=(2, 3))
+
+
+def _tile_stats_pillow(sheet, grid_cols, grid_rows):
+    """Same statistics as tile_stats, one tile at a time, for installs without NumPy."""
+    gray = sheet.convert('L')
+    rgb = sheet.convert('RGB')
+    frame_width = sheet.width // grid_cols
+    frame_height = sheet.height // grid_rows
+    means, maxes, variances = [], [], []
+    for row in range(grid_rows):
+        means.append([])
+        maxes.append([])
+        variances.append([])
+        for col in range(grid_cols):
+            box = (col * frame_width, row * frame_height, (col + 1) * frame_width, (row + 1) * frame_height)
+            stat = ImageStat.Stat(gray.crop(box))
+            means[-1].append(stat.mean[0])
+            variances[-1].append(stat.var[0])
+            maxes[-1].append(max(high for _, high in rgb.crop(box).getextrema()))
+    return means, maxes, variances
+
+
+def find_blank_tiles(sheet, grid_cols, grid_rows, thresholds=None):
+    """Return a rows x cols grid of booleans marking blank tiles, plus the (mean, max, variance) stats."""
+    thresholds = thresholds or BlankThresholds()
+    if NUMPY_AVAILABLE:
+        means, maxes, variances = tile_stats(sheet, grid_cols, grid_rows)
+        blank = (maxes <= thresholds.max) | ((means <= thresholds.mean) & (variances <= thresholds.variance))
+        return blank.tolist(), (means, maxes, variances)
+
+    means, maxes, variances = _tile_stats_pillow(sheet, grid_cols, grid_rows)
+    blank = [
+        [
+            maxes[r][c] <= thresholds.max or (means[r][c] <= thresholds.mean and variances[r][c] <= thresholds.variance)
+            for c in range(grid_cols)
+        ]
+        for r in range(grid_rows)
+    ]
+    return blank, (means, maxes, variances)
@@ -0,0 +1,80 @@
+# ABOUTME: Persistent on-disk cache for ffprobe results stored in SQLite
+# ABOUTME: Entries are keyed by resolved path, file size and mtime so edited files are re-probed
+
+import json
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+CACHE_DIR_ENV = 'SPRITER_CACHE_DIR'
+CACHE_FILENAME = 'probe-cache.sqlite3'
+
+
+def cache_dir():
+    """Return the cache directory ($SPRITER_CACHE_DIR, else $XDG_CACHE_HOME/spriter or ~/.cache/spriter)."""
+    if os.environ.get(CACHE_DIR_ENV):
+        return Path(os.environ[CACHE_DIR_ENV])
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'spriter'
+
+
+def cache_path():
+    return cache_dir() / CACHE_FILENAME
+
+
+def file_identity(input_file):
+    """Identify a file by resolved path, size and modification time."""
+    stat = os.stat(input_file)
+    return str(Path(input_file).resolve()), stat.st_size, stat.st_mtime_ns
+
+
+def _connect():
+    path = cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS entries ('
+        'path TEXT NOT NULL, kind TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, data TEXT NOT NULL, '
+        'PRIMARY KEY (path, kind))'
+    )
+    return conn
+
+
+def cache_get(input_file, kind):
+    """Return the cached value of the given kind for input_file, or None on a miss.
+
+    Cache problems (unreadable database, missing file) are treated as misses.
+    """
+    try:
+        path, size, mtime_ns = file_identity(input_file)
+        with closing(_connect()) as conn, conn:
+            row = conn.execute(
+                'SELECT data FROM entries WHERE path = ? AND kind = ? AND size = ? AND mtime_ns = ?',
+                (path, kind, size, mtime_ns)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    except (OSError, sqlite3.Error, ValueError):
+        return None
+
+
+def cache_put(input_file, kind, data):
+    """Store a JSON-serialisable value for input_file, replacing any stale entry."""
+    try:
+        path, size, mtime_ns = file_identity(input_file)
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (path, kind, size, mtime_ns, data) VALUES (?, ?, ?, ?, ?)',
+                (path, kind, size, mtime_ns, json.dumps(data))
+            )
+    except (OSError, sqlite3.Error, TypeError):
+        pass
+
+
+def clear_cache():
+    """Delete the cache database. Returns True if there was one to delete."""
+    path = cache_path()
+    if not path.exists():
+        return False
+    path.unlink()
+    return True
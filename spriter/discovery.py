@@ -0,0 +1,136 @@
+# ABOUTME: Streaming discovery of input videos from directory trees or file lists
+# ABOUTME: Yields paths as they are found so processing can start before a large scan finishes
+
+import os
+import re
+import sys
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+VIDEO_EXTENSIONS = ('.mov', '.mp4', '.mpg')
+
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def parse_size(value):
+    """Parse a byte count such as 500, 64k, 1.5M or 2G into an int (binary units, case-insensitive)."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size {value!r}; use bytes or a K/M/G/T suffix (e.g. 500M)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+@dataclass(frozen=True)
+class DiscoveryFilter:
+    """Which discovered files to keep.
+
+    Patterns are case-insensitive globs matched against both the file name
+    and the path relative to the scanned directory, so '*_raw.mp4' and
+    'takes/*.mov' both work. A file is kept if it matches any include pattern
+    (or there are none) and no exclude pattern. Directories matching an
+    exclude pattern are not descended into. Sizes are in bytes; None means
+    no limit.
+    """
+    include: tuple[str, ...] = ()
+    exclude: tuple[str, ...] = ()
+    min_size: int | None = None
+    max_size: int | None = None
+
+    def _matches(self, patterns, relative):
+        relative = relative.replace(os.sep, '/').lower()
+        name = relative.rsplit('/', 1)[-1]
+        return any(fnmatchcase(name, pattern.lower()) or fnmatchcase(relative, pattern.lower()) for pattern in patterns)
+
+    def excludes_dir(self, relative):
+        return bool(self.exclude) and self._matches(self.exclude, relative)
+
+    def accepts(self, relative, size):
+        if self.include and not self._matches(self.include, relative):
+            return False
+        if self.exclude and self._matches(self.exclude, relative):
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        return self.max_size is None or size <= self.max_size
+
+
+def scan_directory(root, recursive=False, file_filter=None):
+    """Yield video files under root, in name order per directory, as they are found.
+
+    Uses os.scandir, so each directory is listed once and every entry is seen
+    exactly once: extensions are compared case-insensitively instead of
+    globbing once per spelling, which listed files twice on case-insensitive
+    filesystems. Symlinked directories are not followed.
+    """
+    file_filter = file_filter or DiscoveryFilter()
+    root = Path(root)
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative = os.path.relpath(entry.path, root)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not file_filter.excludes_dir(relative):
+                        subdirectories.append(Path(entry.path))
+                    continue
+                if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in VIDEO_EXTENSIONS:
+                    continue
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            if file_filter.accepts(relative, size):
+                yield Path(entry.path)
+
+        # Depth-first, visiting subdirectories in name order
+        pending.extend(reversed(subdirectories))
+
+
+def read_file_list(lines, file_filter=None):
+    """Yield paths from a file list, one per line; blank lines and '#' comments are skipped.
+
+    The same include/exclude and size filters apply (matched against the path
+    as written) and repeated entries are dropped. Missing files are yielded
+    anyway so they can be reported.
+    """
+    file_filter = file_filter or DiscoveryFilter()
+    seen = set()
+    for line in lines:
+        entry = line.strip()
+        if not entry or entry.startswith('#'):
+            continue
+        path = Path(entry).expanduser()
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            yield path
+            continue
+        if file_filter.accepts(entry, size):
+            yield path
+
+
+def is_list_source(value):
+    """True for the string inputs '-' (paths on stdin) and '@list.txt'; directories are Paths."""
+    return isinstance(value, str) and (value == '-' or value.startswith('@'))
+
+
+def discover(source, recursive=False, file_filter=None):
+    """Yield input videos from a directory Path, '-' (paths on stdin) or '@list.txt'."""
+    if source == '-':
+        yield from read_file_list(sys.stdin, file_filter)
+    elif is_list_source(source):
+        with open(source[1:], encoding='utf-8') as lines:
+            yield from read_file_list(lines, file_filter)
+    else:
+        yield from scan_directory(source, recursive, file_filter)
@@ -0,0 +1,114 @@
+# ABOUTME: Runs ffmpeg with its machine-readable -progress output parsed on a reader thread
+# ABOUTME: Reports out_time/frame/speed updates and kills ffmpeg if progress stalls
+
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ProgressUpdate:
+    """One -progress block: output position in seconds, output frame count, speed multiplier."""
+    out_time: float | None
+    frame: int | None
+    speed: float | None
+    done: bool
+
+
+def progress_command(cmd):
+    """Add -progress pipe:1 -nostats right after the program name of an ffmpeg command."""
+    return cmd[:1] + ['-progress', 'pipe:1', '-nostats'] + cmd[1:]
+
+
+def parse_out_time(value):
+    """Parse ffmpeg's HH:MM:SS.micro out_time (or N/A) into seconds."""
+    try:
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_progress_block(fields):
+    """Build a ProgressUpdate from one block's key=value pairs; missing or N/A values become None."""
+    out_time = None
+    if fields.get('out_time_us', 'N/A').lstrip('-').isdigit():
+        out_time = max(0, int(fields['out_time_us'])) / 1_000_000
+    elif 'out_time' in fields:
+        out_time = parse_out_time(fields['out_time'])
+
+    frame = int(fields['frame']) if fields.get('frame', '').isdigit() else None
+    try:
+        speed = float(fields.get('speed', '').strip().rstrip('x'))
+    except ValueError:
+        speed = None
+    return ProgressUpdate(out_time, frame, speed, fields.get('progress') == 'end')
+
+
+def iter_progress_blocks(lines):
+    """Yield a ProgressUpdate for every block of key=value lines ending in progress=continue/end."""
+    fields = {}
+    for line in lines:
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            continue
+        fields[key] = value.strip()
+        if key == 'progress':
+            yield parse_progress_block(fields)
+            fields = {}
+
+
+def run_with_progress(cmd, on_progress=None, stall_timeout=0, poll_interval=0.25):
+    """Run an ffmpeg command, calling on_progress(ProgressUpdate) from a reader thread.
+
+    cmd must not write its output to stdout, which carries the progress
+    stream. If stall_timeout is set and no progress block arrives for that
+    many seconds, ffmpeg is killed and subprocess.TimeoutExpired is raised.
+    A non-zero exit raises subprocess.CalledProcessError with ffmpeg's stderr.
+    """
+    process = subprocess.Popen(progress_command(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    last_update = time.monotonic()
+    stderr_chunks = []
+
+    def read_progress():
+        nonlocal last_update
+        for update in iter_progress_blocks(process.stdout):
+            last_update = time.monotonic()
+            if on_progress:
+                on_progress(update)
+
+    # stderr is drained on its own thread so a chatty ffmpeg can't block on a full pipe
+    readers = [
+        threading.Thread(target=read_progress, daemon=True),
+        threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+
+    stalled = False
+    try:
+        while True:
+            try:
+                process.wait(timeout=poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                if stall_timeout and time.monotonic() - last_update > stall_timeout:
+                    stalled = True
+                    process.kill()
+                    process.wait()
+                    break
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+
+    stderr = ''.join(stderr_chunks)
+    if stalled:
+        raise subprocess.TimeoutExpired(cmd, stall_timeout, stderr=stderr)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stderr=stderr)
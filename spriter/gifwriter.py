@@ -0,0 +1,65 @@
+# ABOUTME: Streaming animated GIF writer that encodes frames as they are produced
+# ABOUTME: Peak memory stays constant in the number of frames, unlike save(append_images=...)
+
+import os
+
+from PIL import GifImagePlugin, Image
+
+
+class StreamingGifWriter:
+    """Write an animated GIF frame by frame.
+
+    Each frame gets its own adaptive palette (a local colour table), so frames
+    never have to be held together to build a shared one. Output goes to a
+    temporary sibling file that replaces path on close(); abort() discards it.
+    Use as a context manager to get close/abort automatically.
+    """
+
+    def __init__(self, path, duration, loop=0):
+        self.path = path
+        self.duration = duration
+        self.loop = loop
+        self.frame_count = 0
+        self.size = None
+        self._temp_path = path.with_name(path.name + '.part')
+        self._fp = open(self._temp_path, 'wb')
+
+    def add_frame(self, frame):
+        """Encode one frame. Frames are resized to the first frame's size if they differ."""
+        if self.size is None:
+            self.size = frame.size
+        elif frame.size != self.size:
+            frame = frame.resize(self.size, Image.LANCZOS)
+
+        indexed = frame.convert('RGB').convert('P', palette=Image.Palette.ADAPTIVE)
+        if self.frame_count == 0:
+            header, _ = GifImagePlugin.getheader(indexed, info={'loop': self.loop, 'duration': self.duration})
+            self._fp.write(b''.join(header))
+        for chunk in GifImagePlugin.getdata(indexed, include_color_table=True, duration=self.duration):
+            self._fp.write(chunk)
+        self.frame_count += 1
+
+    def close(self):
+        """Finish the file. Returns False (and writes nothing) if no frame was added."""
+        if self.frame_count == 0:
+            self.abort()
+            return False
+        self._fp.write(b';')  # GIF trailer
+        self._fp.close()
+        os.replace(self._temp_path, self.path)
+        return True
+
+    def abort(self):
+        self._fp.close()
+        if self._temp_path.exists():
+            self._temp_path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, _exc, _tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
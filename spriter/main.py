@@ -1,100 +1,625 @@
 # ABOUTME: Video to sprite sheet converter using ffmpeg
 # ABOUTME: Converts MOV/MP4 videos into tile-based sprite sheets for animations
 
+import io
+import os
+import re
 import subprocess
 import sys
-import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import ExitStack
 from pathlib import Path
 import click
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich.progress import (Progress, SpinnerColumn, TextColumn, BarColumn, MofNCompleteColumn, TimeElapsedColumn,
+                           TaskProgressColumn, TimeRemainingColumn)
 from rich.panel import Panel
 from rich.text import Text
 
+from spriter.cache import cache_path, clear_cache
+from spriter.discovery import DiscoveryFilter, discover, is_list_source, parse_size
+from spriter.ffprogress import run_with_progress
+from spriter.manifest import MANIFEST_NAME, Manifest, job_fingerprint
+from spriter.metadata import METADATA_FORMATS, detect_blank_frames, grid_metadata, write_metadata
+from spriter.palette import DITHER_MODES, add_palette_input, first_pass_palette, palette_filter, paletteuse_filter
+from spriter.pages import (find_pages, index_path, page_pattern, remove_pages, sample_window, tile_frame_count,
+                           tile_sheet_command, write_page_index)
+from spriter.probe import estimate_frame_count, probe_video
+from spriter.profiling import Profiler
+from spriter.rawpipe import NUMPY_AVAILABLE, build_raw_sheets
+
 try:
     from PIL import Image
+    from spriter.atlas import build_atlas
+    from spriter.blank import BlankThresholds, find_blank_tiles
+    from spriter.gifwriter import StreamingGifWriter
+    from spriter.sampling import build_seek_sheet, sample_timestamps
     PIL_AVAILABLE = True
 except ImportError:
     PIL_AVAILABLE = False
 
+# Named fps/size/grid configurations selectable with --preset
+PRESETS = {
+    'game': {'fps': 10, 'size': '64x64', 'grid': '6x6'},
+    'web': {'fps': 8, 'size': '32x32', 'grid': '4x4'},
+    'hires': {'fps': 12, 'size': '128x128', 'grid': '8x8'}
+}
+
+# process_video_file options that change how a run goes but not what it writes
+RUNTIME_OPTIONS = ('use_cache', 'stall_timeout')
+
+
+def clear_cache_callback(ctx, _param, value):
+    """Delete the probe cache and exit (runs before INPUT is validated)."""
+    if not value or ctx.resilient_parsing:
+        return
+    if clear_cache():
+        click.echo(f"Cleared probe cache: {cache_path()}")
+    else:
+        click.echo("Probe cache is already empty")
+    ctx.exit()
+
+
+def validate_input_path(ctx, _param, value):
+    """Accept an existing file or directory, '-' (paths on stdin) or '@list.txt'."""
+    if value == '-':
+        return value
+    if value.startswith('@'):
+        if not Path(value[1:]).is_file():
+            raise click.BadParameter(f"File list '{value[1:]}' does not exist.")
+        return value
+    if not Path(value).exists():
+        raise click.BadParameter(f"Path '{value}' does not exist.")
+    return Path(value)
+
+
+def validate_byte_size(ctx, _param, value):
+    if value is None:
+        return None
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def validate_gif_size(ctx, _param, value):
+    """Accept 'sheet', 'source' or a WxH size for --gif-size."""
+    if value in ('sheet', 'source') or re.fullmatch(r'[1-9]\d*x[1-9]\d*', value):
+        return value
+    raise click.BadParameter("must be 'sheet', 'source' or WxH (e.g. 128x128)")
+
+
+def validate_dimensions(ctx, _param, value):
+    """Parse a WxH option such as --atlas-size into a (width, height) tuple."""
+    match = re.fullmatch(r'([1-9]\d*)x([1-9]\d*)', value)
+    if not match:
+        raise click.BadParameter("must be WxH (e.g. 2048x2048)")
+    return int(match.group(1)), int(match.group(2))
+
+
+def validate_color(ctx, _param, value):
+    """Parse a color name or hex code such as 'lime' or '#00ff00' into an RGB tuple."""
+    if value is None:
+        return None
+    from PIL import ImageColor
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except ValueError:
+        raise click.BadParameter("must be a color name or hex code (e.g. '#00ff00')")
+
 
 @click.command()
-@click.argument('input_path', type=click.Path(exists=True, path_type=Path), metavar='INPUT_FILE_OR_DIRECTORY')
+@click.argument('input_path', callback=validate_input_path, metavar='INPUT_FILE_OR_DIRECTORY')
 @click.option('--output', '-o', type=click.Path(path_type=Path), help='Output sprite sheet file (default: input_name_spritesheet_[params].png)')
 @click.option('--fps', '-f', default=10, help='Frames per second to extract (default: 10)')
 @click.option('--size', '-s', default='64x64', help='Size of each sprite frame (default: 64x64)')
 @click.option('--grid', '-g', default='6x6', help='Grid layout for sprites (default: 6x6)')
-@click.option('--preset', '-p', type=click.Choice(['game', 'web', 'hires']), help='Use preset configuration (game=64x64/10fps/6x6, web=32x32/8fps/4x4, hires=128x128/12fps/8x8)')
+@click.option('--preset', '-p', 'presets', multiple=True, type=click.Choice(list(PRESETS)), help='Use preset configuration (game=64x64/10fps/6x6, web=32x32/8fps/4x4, hires=128x128/12fps/8x8); repeat to build several presets from one decode')
+@click.option('--all-presets', is_flag=True, help='Build every preset from a single decode of each video')
 @click.option('--loop', '-l', is_flag=True, help='Ensure smooth looping by adding first frame at end')
 @click.option('--create-gif', is_flag=True, help='Also create an animated GIF to test the loop')
-def main(input_path, output, fps, size, grid, preset, loop, create_gif):
-    """Convert a video file (MOV/MP4) or directory of videos into sprite sheets."""
+@click.option('--gif-mode', type=click.Choice(['pillow', 'ffmpeg']), default='pillow', help='How --create-gif builds the preview: pillow = slice the saved sheet, ffmpeg = palette GIF from the same decode as the sheet, keeping blank frames (default: pillow)')
+@click.option('--gif-size', default='sheet', callback=validate_gif_size, help="Preview GIF frame size: 'sheet' (tile size), 'source' (video resolution) or WxH (default: sheet)")
+@click.option('--gif-max-memory', default=256, type=click.IntRange(min=0), help='Shrink preview GIF frames if the frames held while encoding (every frame with --gif-mode ffmpeg) would exceed this many MB (0 = no limit, default: 256)')
+@click.option('--blank-mean', default=10.0, show_default=True, help='GIF frames darker than this average brightness (0-255) count as blank if also flat (pillow GIF mode)')
+@click.option('--blank-variance', default=25.0, show_default=True, help='GIF frames with brightness variance at most this count as flat')
+@click.option('--blank-max', default=16.0, show_default=True, help='GIF frames whose brightest value is at most this are always blank')
+@click.option('--recursive', '-r', is_flag=True, help='For directory input, also process videos in subdirectories')
+@click.option('--include', multiple=True, help="For directory/list input, only process files matching this glob, e.g. '*_final.mp4' or 'takes/*' (repeatable)")
+@click.option('--exclude', multiple=True, help="For directory/list input, skip files and directories matching this glob (repeatable)")
+@click.option('--min-size', callback=validate_byte_size, help='For directory/list input, skip files smaller than this (bytes, or with a K/M/G suffix)')
+@click.option('--max-size', callback=validate_byte_size, help='For directory/list input, skip files larger than this (bytes, or with a K/M/G suffix)')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=0), help='Number of videos to process in parallel for directory input (0 = all CPU cores, default: 1)')
+@click.option('--sampling', type=click.Choice(['fps', 'seek', 'seek-exact']), default='fps', help='Frame sampling: fps = consecutive frames from the start, seek = evenly spaced keyframes over the whole video, seek-exact = evenly spaced exact frames (default: fps)')
+@click.option('--backend', type=click.Choice(['tile', 'raw']), default='tile', help="Sheet assembly: tile = ffmpeg's tile filter, raw = raw frames piped into a NumPy sheet (requires numpy) (default: tile)")
+@click.option('--paginate', is_flag=True, help='Write every frame across numbered sheets (name_0.png, name_1.png, ...) plus a name_index.json, from one decode pass')
+@click.option('--max-pages', default=0, type=click.IntRange(min=0), help='With --paginate, stop after this many pages (0 = whole video, default: 0)')
+@click.option('--atlas', is_flag=True, help='Pack every video\'s frames into shared texture atlas pages plus a JSON sidecar instead of one sheet per video')
+@click.option('--atlas-size', default='2048x2048', callback=validate_dimensions, help='Atlas page size in pixels (default: 2048x2048)')
+@click.option('--atlas-padding', default=1, type=click.IntRange(min=0), help='Transparent pixels left between atlas frames (default: 1)')
+@click.option('--trim', is_flag=True, help='Crop each frame to its visible content (alpha, or --trim-key) and pack only the trimmed rects, recording offsets in the sidecar (implies --atlas)')
+@click.option('--trim-key', callback=validate_color, help="With --trim, treat this background color as transparent, e.g. '#00ff00' for green screen")
+@click.option('--trim-tolerance', default=16, type=click.IntRange(0, 255), help='With --trim-key, how far (0-255 per channel) a pixel may be from the key color and still count as background (default: 16)')
+@click.option('--dedup', type=click.Choice(['exact', 'perceptual']), help='Store repeated frames once in the atlas: exact = identical pixels, perceptual = same difference hash (tolerates compression noise) (implies --atlas)')
+@click.option('--palette', default=0, type=click.IntRange(0, 256), help='Write 8-bit indexed PNGs with at most this many colors, one palette shared by every page of a sheet or atlas (0 = full color, default: 0)')
+@click.option('--dither', type=click.Choice(DITHER_MODES), default='floyd-steinberg', help='Dithering used when mapping frames onto the --palette colors (default: floyd-steinberg)')
+@click.option('--metadata', 'metadata', multiple=True, default=['json'], type=click.Choice([*METADATA_FORMATS, 'none']), help='Frame metadata sidecar(s) written next to each sheet or atlas: json (name.json), texturepacker-hash or texturepacker-array (name.tp-hash.json / name.tp-array.json per page), or none; repeatable (default: json)')
+@click.option('--decode-frame-count', is_flag=True, help='In loop mode, fully decode the video to count frames if the header, packet count and duration estimate all fail (slow)')
+@click.option('--no-cache', is_flag=True, help='Always run ffprobe instead of reading the on-disk probe cache')
+@click.option('--incremental', is_flag=True, help=f'Skip videos whose outputs are up to date, tracked by a fingerprint of the input and all options in {MANIFEST_NAME} next to the outputs')
+@click.option('--stall-timeout', default=0.0, type=click.FloatRange(min=0), help='Kill ffmpeg and fail the file if it reports no progress for this many seconds (0 = never, default: 0)')
+@click.option('--profile', is_flag=True, help='Print a per-stage timing and counter breakdown when done')
+@click.option('--profile-json', type=click.Path(dir_okay=False, path_type=Path), help='Also write the --profile breakdown as JSON to this file (implies --profile)')
+@click.option('--clear-cache', is_flag=True, expose_value=False, is_eager=True, callback=clear_cache_callback, help='Delete the on-disk probe cache and exit')
+def main(input_path, output, fps, size, grid, presets, all_presets, loop, create_gif, gif_mode, gif_size, gif_max_memory, blank_mean, blank_variance, blank_max, recursive, include, exclude, min_size, max_size, jobs, sampling, backend, paginate, max_pages, atlas, atlas_size, atlas_padding, trim, trim_key, trim_tolerance, dedup, palette, dither, metadata, decode_frame_count, no_cache, incremental, stall_timeout, profile, profile_json):
+    """Convert a video file (MOV/MP4) or directory of videos into sprite sheets.
+    
+    INPUT can also be '-' to read video paths from stdin, or @list.txt to
+    read them from a file, one per line.
+    """
     
     console = Console()
+    profiler = Profiler()
     
-    # Apply preset configurations if specified
-    if preset:
-        preset_configs = {
-            'game': {'fps': 10, 'size': '64x64', 'grid': '6x6'},
-            'web': {'fps': 8, 'size': '32x32', 'grid': '4x4'},
-            'hires': {'fps': 12, 'size': '128x128', 'grid': '8x8'}
-        }
-        config = preset_configs[preset]
+    if paginate and sampling != 'fps':
+        raise click.UsageError("--paginate only works with --sampling fps")
+    if backend == 'raw' and sampling != 'fps':
+        raise click.UsageError("--backend raw only works with --sampling fps")
+    if backend == 'raw' and not (NUMPY_AVAILABLE and PIL_AVAILABLE):
+        raise click.UsageError("--backend raw requires numpy and Pillow (pip install numpy)")
+    
+    # Several presets share one decode; a single preset just sets fps/size/grid
+    presets = tuple(PRESETS) if all_presets else tuple(dict.fromkeys(presets))
+    if len(presets) > 1:
+        if sampling != 'fps' or backend != 'tile' or paginate:
+            raise click.UsageError("Multiple presets only work with --sampling fps, --backend tile and no --paginate")
+        preset = presets
+        console.print(f"[yellow]Using presets {', '.join(presets)} from a single decode per video[/yellow]")
+    elif presets:
+        preset = presets[0]
+        config = PRESETS[preset]
         fps = config['fps']
         size = config['size']
         grid = config['grid']
         console.print(f"[yellow]Using preset '{preset}': fps={fps}, size={size}, grid={grid}[/yellow]")
+    else:
+        preset = None
+    
+    if trim_key and not trim:
+        raise click.UsageError("--trim-key only works with --trim")
+    atlas = atlas or trim or bool(dedup)
+    if atlas:
+        if sampling != 'fps' or paginate or loop or create_gif or isinstance(preset, tuple):
+            raise click.UsageError("--atlas only works with --sampling fps and a single preset, without --loop, --create-gif or --paginate")
+        if not PIL_AVAILABLE:
+            raise click.UsageError("--atlas requires Pillow (pip install Pillow)")
+    
+    batch = is_list_source(input_path) or input_path.is_dir()
+    if output and batch and jobs != 1 and not atlas:
+        raise click.UsageError("--output names a single sheet, so it can't be used with --jobs on a directory or file list; "
+                               "leave it out to name each sheet after its input")
+    
+    metadata_formats = () if 'none' in metadata else tuple(dict.fromkeys(metadata))
+    if palette == 1:
+        raise click.UsageError("--palette needs at least 2 colors")
+    if palette and not PIL_AVAILABLE:
+        raise click.UsageError("--palette requires Pillow (pip install Pillow)")
     
     # Check if ffmpeg is available
     try:
-        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+        with profiler.stage('ffmpeg check'):
+            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
     except (subprocess.CalledProcessError, FileNotFoundError):
         console.print("[red]Error: ffmpeg is not installed or not in PATH[/red]")
         sys.exit(1)
     
-    # Handle directory input
-    if input_path.is_dir():
-        # Find all video files in the directory
-        video_extensions = ['.mov', '.mp4', '.mpg']
-        video_files = []
-        for ext in video_extensions:
-            video_files.extend(input_path.glob(f"*{ext}"))
-            video_files.extend(input_path.glob(f"*{ext.upper()}"))
-        
-        if not video_files:
-            console.print(f"[red]Error: No video files found in directory '{input_path}'[/red]")
-            sys.exit(1)
+    # --incremental skips files whose outputs were built from the same input and parameters
+    manifest = Manifest() if incremental else None
+    
+    # Options forwarded unchanged to every process_video_file call
+    options = {
+        'use_cache': not no_cache,
+        'decode_frame_count': decode_frame_count,
+        'sampling': sampling,
+        'paginate': paginate,
+        'max_pages': max_pages,
+        'gif_mode': gif_mode,
+        'backend': backend,
+        'blank_thresholds': BlankThresholds(mean=blank_mean, max=blank_max, variance=blank_variance) if PIL_AVAILABLE else None,
+        'gif_size': gif_size,
+        'gif_max_memory': gif_max_memory,
+        'stall_timeout': stall_timeout,
+        'metadata_formats': metadata_formats,
+        'palette': palette,
+        'dither': dither,
+        'manifest': manifest,
+        'profiler': profiler
+    }
+    
+    atlas_options = {
+        'page_size': atlas_size,
+        'padding': atlas_padding,
+        'trim': trim,
+        'key_color': trim_key,
+        'tolerance': trim_tolerance,
+        'dedup': dedup,
+        'metadata_formats': metadata_formats,
+        'palette': palette,
+        'dither': dither
+    }
+    
+    try:
+        # Handle directory and file-list input
+        if batch:
+            file_filter = DiscoveryFilter(tuple(include), tuple(exclude), min_size, max_size)
+            source_label = 'stdin' if input_path == '-' else str(input_path).removeprefix('@')
+            
+            # Files are streamed from discovery, so work starts before a large scan finishes
+            console.print(f"[cyan]Scanning '{source_label}' for video files...[/cyan]")
+            video_files = profiler.iterate('discovery', discover(input_path, recursive, file_filter))
+            
+            if jobs == 0:
+                jobs = os.cpu_count() or 1
+            
+            if atlas:
+                atlas_dir = input_path if isinstance(input_path, Path) else Path.cwd()
+                output_file = output or default_atlas_path(atlas_dir, fps, size, grid, preset)
+                results = process_atlas(video_files, output_file, fps, size, grid, console, jobs, profiler, **atlas_options)
+            elif jobs > 1:
+                results = process_files_parallel(video_files, output, fps, size, grid, preset, loop, create_gif, console, jobs, **options)
+            else:
+                results = {}
+                for i, video_file in enumerate(video_files, 1):
+                    console.print(f"\n[bold]Processing {i}: {video_file.name}[/bold]")
+                    results[video_file] = process_video_file(video_file, output, fps, size, grid, preset, loop, create_gif, console, **options)
+            
+            if not results:
+                console.print(f"[red]Error: No video files found in '{source_label}'[/red]")
+                sys.exit(1)
+            
+            console.print(f"\n[cyan]Found {len(results)} video files in '{source_label}'[/cyan]")
+            print_batch_summary(results, console)
+        elif atlas:
+            output_file = output or default_atlas_path(input_path.parent, fps, size, grid, preset, f"{input_path.stem}_atlas")
+            process_atlas([input_path], output_file, fps, size, grid, console, 1, profiler, **atlas_options)
+        else:
+            # Process single file
+            process_video_file(input_path, output, fps, size, grid, preset, loop, create_gif, console, **options)
+    finally:
+        if manifest is not None:
+            manifest.flush()
+    
+    if profile or profile_json:
+        print_profile(profiler, console, profile_json)
+
+
+def print_profile(profiler, console, json_path=None):
+    """Print the --profile breakdown and optionally save it as JSON."""
+    console.print()
+    console.print(profiler.table())
+    if json_path:
+        profiler.write_json(json_path)
+        console.print(f"[dim]Profile written to {json_path}[/dim]")
+
+
+def process_files_parallel(video_files, output, fps, size, grid, preset, loop, create_gif, console, jobs, **options):
+    """Process several video files at once with a bounded worker pool.
+    
+    Each worker renders into its own buffered console so the ffmpeg spinners
+    don't fight over the terminal; the main console shows a single overall
+    progress bar and replays a job's log only when that job fails.
+    video_files may be a lazy iterable: files are submitted as they are
+    discovered, staying at most two per worker ahead of the pool.
+    """
+    
+    def run_job(video_file):
+        job_console = Console(file=io.StringIO(), width=console.width)
+        try:
+            success = process_video_file(video_file, output, fps, size, grid, preset, loop, create_gif, job_console, **options)
+        except Exception as e:
+            job_console.print(f"[red]Error: {e}[/red]")
+            success = False
+        return success, job_console.file.getvalue()
+    
+    discovered = []
+    results = {}
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        console=console
+    ) as progress:
+        task = progress.add_task(f"Processing with {jobs} workers...", total=None)
         
-        # Process each video file
-        console.print(f"[cyan]Found {len(video_files)} video files in '{input_path}'[/cyan]")
+        def collect(done):
+            for future in done:
+                video_file = pending.pop(future)
+                success, log = future.result()
+                results[video_file] = success
+                if success:
+                    progress.console.print(f"[green]✓ {video_file.name}[/green]")
+                else:
+                    progress.console.print(f"[red]✗ {video_file.name}[/red]")
+                    progress.console.out(log, highlight=False)
+                progress.advance(task)
         
-        for i, video_file in enumerate(video_files, 1):
-            console.print(f"\n[bold]Processing {i}/{len(video_files)}: {video_file.name}[/bold]")
-            process_video_file(video_file, output, fps, size, grid, preset, loop, create_gif, console)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = {}
+            for video_file in video_files:
+                discovered.append(video_file)
+                pending[executor.submit(run_job, video_file)] = video_file
+                if len(pending) >= jobs * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            
+            # Discovery is finished, so the bar can show a real total
+            progress.update(task, total=len(discovered))
+            collect(as_completed(list(pending)))
+    
+    # Report results in discovery order rather than completion order
+    return {video_file: results[video_file] for video_file in discovered}
+
+
+def default_atlas_path(directory, fps, size, grid, preset=None, name='atlas'):
+    """Atlas path in directory, named after the preset or the fps/size/grid parameters."""
+    if preset:
+        return directory / f"{name}_{preset}.png"
+    return directory / f"{name}_{fps}fps_{size}_{grid}.png"
+
+
+def process_atlas(video_files, output_file, fps, size, grid, console, jobs, profiler, **atlas_options):
+    """Pack the frames of every discovered video into shared atlas pages.
+    
+    Each video contributes the frames one of its sheets would hold (grid
+    cols*rows frames at fps) and is decoded exactly once. atlas_options are
+    passed on to build_atlas (page size, padding, trimming). Returns
+    {video_file: success} like the per-file modes.
+    """
+    video_files = list(video_files)
+    missing = [video_file for video_file in video_files if not video_file.is_file()]
+    clips = [video_file for video_file in video_files if video_file.is_file()]
+    if not clips:
+        return {video_file: False for video_file in video_files}
+    
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    try:
+        with console.status(f"[cyan]Extracting frames from {len(clips)} videos for the atlas...[/cyan]"):
+            pages, sidecar, failed = build_atlas(clips, output_file, fps, size, grid_cols * grid_rows, sample_window(fps, grid),
+                                                 jobs=jobs, profiler=profiler, **atlas_options)
+    except ValueError as e:
+        console.print(f"[red]Error: {e}[/red]")
+        return {video_file: False for video_file in video_files}
+    
+    for video_file, error in failed.items():
+        console.print(f"[red]✗ {video_file.name}: {getattr(error, 'stderr', None) or error}[/red]")
+    for video_file in missing:
+        console.print(f"[red]✗ {video_file}: file not found[/red]")
+    
+    page_list = ', '.join(page.name for page in pages)
+    console.print(f"[green]✓ Packed {len(clips) - len(failed)} animations into {len(pages)} atlas page(s): {page_list}[/green]")
+    console.print(f"[dim]Frame rects written to {sidecar}[/dim]")
+    return {video_file: video_file not in failed and video_file not in missing for video_file in video_files}
+
+
+def print_batch_summary(results, console):
+    """Print per-file success/failure counts for a directory run."""
+    failed = [video_file for video_file, success in results.items() if not success]
+    succeeded = len(results) - len(failed)
+    
+    console.print(f"\n[bold]Processed {len(results)} files: [green]{succeeded} succeeded[/green], [red]{len(failed)} failed[/red][/bold]")
+    for video_file in failed:
+        console.print(f"[red]  ✗ {video_file}[/red]")
+
+
+def add_gif_output(cmd, fps, size, grid, gif_path, max_frames=None, gif_size='sheet', sheet_filter=''):
+    """Turn a single-output ``-vf`` sheet command into one that also writes a palette GIF.
+    
+    The sampled frames are split: one branch is tiled into the sheet as before,
+    the other runs palettegen/paletteuse into the GIF, so the video is decoded
+    once and no Python-side GIF encoding is needed. max_frames trims the GIF
+    to the frames that actually land in the sheet(s), and the first frame is
+    appended again at the end so the preview loops the way the Pillow one
+    does (blank tiles are not dropped here). gif_size is 'sheet' (reuse the
+    scaled tiles), 'source' (full resolution) or 'WxH'.
+    sheet_filter (a ',' + palette_filter(...) or paletteuse_filter(...) chain)
+    is appended after the sheet's tile filter.
+    """
+    trim = f'trim=end_frame={max_frames},' if max_frames else ''
+    if gif_size == 'sheet':
+        head = f'[0:v]fps={fps},scale={size},split=2[tiles][anim];[tiles]tile={grid}{sheet_filter}[sheet];'
+        scale = ''
+    else:
+        head = f'[0:v]fps={fps},split=2[full][anim];[full]scale={size},tile={grid}{sheet_filter}[sheet];'
+        scale = '' if gif_size == 'source' else f'scale={gif_size},'
+    graph = (
+        head
+        + f'[anim]{scale}{trim}split=2[body][first];'
+        + '[first]trim=end_frame=1[loop_frame];'
+        + '[body][loop_frame]concat=n=2:v=1:a=0,split=2[frames][palette_in];'
+        + '[palette_in]palettegen[palette];'
+        + '[frames][palette]paletteuse[gif]'
+    )
+    vf_index = cmd.index('-vf')
+    return (
+        cmd[:vf_index]
+        + ['-filter_complex', graph, '-map', '[sheet]']
+        + cmd[vf_index + 2:]
+        + ['-map', '[gif]', '-loop', '0', '-y', str(gif_path)]
+    )
+
+
+def default_output_path(input_file, fps, size, grid, preset=None):
+    """Sheet path next to the input, named after the preset or the fps/size/grid parameters."""
+    if preset:
+        return input_file.parent / f"{input_file.stem}_spritesheet_{preset}.png"
+    # Include parameters in filename for easy identification
+    return input_file.parent / f"{input_file.stem}_spritesheet_{fps}fps_{size}_{grid}.png"
+
+
+def job_outputs(input_file, output, preset, primary, create_gif, paginate):
+    """Every file a finished job left behind, for the incremental-build manifest."""
+    if isinstance(preset, (list, tuple)):
+        sheets = [preset_output_path(input_file, output, name) for name in preset]
+        gifs = [sheet.with_suffix('.gif') for sheet in sheets]
+    elif paginate:
+        sheets = find_pages(primary) + [index_path(primary)]
+        gifs = [primary.with_suffix('.gif')]
     else:
-        # Process single file
-        process_video_file(input_path, output, fps, size, grid, preset, loop, create_gif, console)
+        sheets = [primary]
+        gifs = [primary.with_suffix('.gif')]
+    sidecars = [sheet.with_suffix(suffix) for sheet in sheets + [primary] for suffix in ('.json', '.tp-hash.json', '.tp-array.json')]
+    return [path for path in dict.fromkeys(sheets + sidecars + (gifs if create_gif else [])) if path.exists()]
+
+
+def conversion_progress(console):
+    """Transient progress display for one ffmpeg conversion (bar, ETA and speed fill in when known)."""
+    return Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(),
+        TimeRemainingColumn(),
+        TextColumn("[dim]{task.fields[speed]}[/dim]"),
+        console=console,
+        transient=True
+    )
+
+
+def report_ffmpeg_error(error, progress, task, console, profiler):
+    """Mark the conversion task failed and print why ffmpeg stopped."""
+    if isinstance(error, subprocess.TimeoutExpired):
+        progress.update(task, description="✗ Conversion stalled!")
+        console.print(f"[red]Error: ffmpeg made no progress for {error.timeout:g}s and was stopped[/red]")
+        profiler.count('stalled jobs')
+        return
+    progress.update(task, description="✗ Conversion failed!")
+    console.print(f"[red]Error running ffmpeg: {error}[/red]")
+    if error.stderr:
+        console.print(f"[red]ffmpeg error: {error.stderr}[/red]")
 
 
-def process_video_file(input_file, output, fps, size, grid, preset, loop, create_gif, console):
-    """Process a single video file into a sprite sheet."""
+def expected_output_seconds(fps, grid, paginate, max_pages, video_info):
+    """Output timeline length ffmpeg's out_time will reach, or None if unknown.
+    
+    A single sheet is run through track_input_time, so out_time follows the
+    input up to the sample window. Paginated runs advance one page at a time.
+    """
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    sheet_seconds = grid_cols * grid_rows / fps
+    duration = video_info.duration if video_info else None
+    if not paginate:
+        window = sample_window(fps, grid)
+        return min(window, duration) if duration else window
+    if max_pages:
+        return min(sheet_seconds * max_pages, duration) if duration else sheet_seconds * max_pages
+    return duration
+
+
+def track_input_time(cmd):
+    """Add a stream-copy null output so ffmpeg's out_time follows the input read position.
+    
+    The tile filter stamps each sheet with its first frame's time, so a single
+    sheet output alone keeps out_time at zero until ffmpeg exits.
+    """
+    return cmd + ['-map', '0:v:0', '-c', 'copy', '-f', 'null', '-']
+
+
+def probe_or_none(input_file, use_cache, profiler):
+    """probe_video timed as the 'probe' stage, or None if ffprobe fails (callers fall back to defaults)."""
+    try:
+        with profiler.stage('probe'):
+            return probe_video(input_file, use_cache=use_cache)
+    except Exception:
+        return None
+
+
+def run_ffmpeg_with_bar(cmd, progress, task, total, stall_timeout=0):
+    """Run cmd via run_with_progress, driving task's bar, ETA and speed from ffmpeg's -progress output."""
+    progress.update(task, total=total)
+    
+    def on_progress(update):
+        fields = {'speed': f'{update.speed:.1f}x'} if update.speed else {}
+        if total and update.out_time is not None:
+            fields['completed'] = min(update.out_time, total)
+        progress.update(task, **fields)
+    
+    run_with_progress(cmd, on_progress, stall_timeout)
+    if total:
+        progress.update(task, completed=total)
+
+
+def process_video_file(input_file, output, fps, size, grid, preset, loop, create_gif, console, manifest=None, profiler=None, **options):
+    """Process a single video file into a sprite sheet.
+    
+    Checks the input, then hands off to _process_video_file, which takes the
+    remaining keyword options. With a manifest (a Manifest), the file is
+    skipped when its outputs are up to date and recorded once built.
+    """
+    profiler = profiler or Profiler()
     
     # Validate input file format
     if input_file.suffix.lower() not in ['.mov', '.mp4', '.mpg']:
         console.print(f"[red]Error: Unsupported file format '{input_file.suffix}'. Supported formats: .mov, .mp4, .mpg[/red]")
         return False
     
-    # Generate output filename if not provided
-    if not output:
-        if preset:
-            output_file = input_file.parent / f"{input_file.stem}_spritesheet_{preset}.png"
-        else:
-            # Include parameters in filename for easy identification
-            size_clean = size.replace('x', 'x')  # Keep as-is
-            grid_clean = grid.replace('x', 'x')  # Keep as-is
-            output_file = input_file.parent / f"{input_file.stem}_spritesheet_{fps}fps_{size_clean}_{grid_clean}.png"
+    # Paths from a file list are not checked up front
+    if not input_file.is_file():
+        console.print(f"[red]Error: '{input_file}' does not exist or is not a file[/red]")
+        return False
+    
+    if manifest is None:
+        return _process_video_file(input_file, output, fps, size, grid, preset, loop, create_gif, console, profiler=profiler, **options)
+    
+    # Every option shapes the outputs except the ones that only affect how the run goes
+    params = {
+        'output': output, 'fps': fps, 'size': size, 'grid': grid, 'preset': preset, 'loop': loop, 'create_gif': create_gif,
+        **{name: value for name, value in options.items() if name not in RUNTIME_OPTIONS}
+    }
+    if isinstance(preset, (list, tuple)):
+        primary = preset_output_path(input_file, output, preset[0])
     else:
-        output_file = output
+        primary = output or default_output_path(input_file, fps, size, grid, preset)
+    fingerprint = job_fingerprint(input_file, params)
+    if manifest.is_current(primary, fingerprint):
+        console.print(f"[dim]Up to date: {primary}[/dim]")
+        profiler.count('skipped (up to date)')
+        return True
+    
+    success = _process_video_file(input_file, output, fps, size, grid, preset, loop, create_gif, console, profiler=profiler, **options)
+    if success:
+        paginate = options.get('paginate', False)
+        manifest.record(primary, fingerprint, job_outputs(input_file, output, preset, primary, create_gif, paginate))
+    return success
+
+
+def _process_video_file(input_file, output, fps, size, grid, preset, loop, create_gif, console, use_cache=True, decode_frame_count=False,
+                        sampling='fps', paginate=False, max_pages=0, gif_mode='pillow', backend='tile', blank_thresholds=None,
+                        gif_size='sheet', gif_max_memory=256, stall_timeout=0, metadata_formats=('json',), palette=0,
+                        dither='floyd-steinberg', profiler=None):
+    """Build the sprite sheet(s) for one checked input file.
+    
+    preset may also be a tuple of preset names, which are all built from one
+    decode (see process_video_presets). Stage times and counters are added
+    to profiler (a Profiler) if given. On a terminal, or when stall_timeout
+    is set, the ffmpeg run reports real progress and is killed if no progress
+    arrives for stall_timeout seconds. Frame metadata sidecars are written
+    next to the sheet(s) in each of metadata_formats. With palette (a color
+    count), sheets are written as indexed PNGs; the pages of a paginated run
+    share one palette built by a first pass over the source's keyframes.
+    """
+    profiler = profiler or Profiler()
+    
+    # A tuple of preset names builds all of them from one decode
+    if isinstance(preset, (list, tuple)):
+        return process_video_presets(input_file, output, preset, loop, create_gif, console, use_cache=use_cache, gif_mode=gif_mode,
+                                     blank_thresholds=blank_thresholds, gif_size=gif_size, gif_max_memory=gif_max_memory,
+                                     stall_timeout=stall_timeout, metadata_formats=metadata_formats, palette=palette, dither=dither,
+                                     profiler=profiler)
+    
+    # Generate output filename if not provided
+    output_file = output or default_output_path(input_file, fps, size, grid, preset)
     
     # Show configuration
     config_text = Text()
@@ -108,21 +633,27 @@ def process_video_file(input_file, output, fps, size, grid, preset, loop, create
     config_text.append(size, style="yellow")
     config_text.append("\nGrid: ", style="bold")
     config_text.append(grid, style="yellow")
+    if sampling != 'fps':
+        config_text.append("\nSampling: ", style="bold")
+        config_text.append(sampling, style="yellow")
     
     console.print(Panel(config_text, title="🎬 Sprite Sheet Configuration", border_style="blue"))
     
+    # Metadata is probed at most once per file and shared with the GIF step
+    video_info = None
+    
     # Build ffmpeg command
     if loop:
         # For seamless looping, ensure sprites end on a neutral frame
         console.print("[yellow]Creating sprite sheet with seamless looping...[/yellow]")
         
-        # Get video duration to calculate proper sampling
-        try:
-            probe_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_entries', 'format=duration', str(input_file)]
-            result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
-            duration = float(json.loads(result.stdout)['format']['duration'])
+        # Probe once for duration and frame count; the result is reused for the GIF
+        video_info = probe_or_none(input_file, use_cache, profiler)
+        
+        if video_info and video_info.duration:
+            duration = video_info.duration
             console.print(f"[dim]Video duration: {duration:.2f}s[/dim]")
-        except Exception:
+        else:
             # Fallback if we can't get duration
             duration = 5.0
             console.print(f"[dim]Using fallback duration: {duration:.2f}s[/dim]")
@@ -130,22 +661,18 @@ def process_video_file(input_file, output, fps, size, grid, preset, loop, create
         grid_cols, grid_rows = map(int, grid.split('x'))
         total_frames = grid_cols * grid_rows
         
-        # Get video frame count and calculate how many frames we'll get at the target FPS
-        try:
-            probe_cmd = ['ffprobe', '-v', 'quiet', '-count_frames', '-select_streams', 'v:0', '-show_entries', 'stream=nb_frames', '-of', 'csv=p=0', str(input_file)]
-            result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
-            video_frames = int(result.stdout.strip()) if result.stdout.strip().isdigit() else 0
+        # Calculate how many frames we'll get at the target FPS
+        with profiler.stage('probe'):
+            video_frames, count_method = estimate_frame_count(input_file, video_info, allow_decode=decode_frame_count, use_cache=use_cache)
+        if video_frames:
+            expected_frames = min(int(duration * fps), video_frames)
+            console.print(f"[dim]Video has {video_frames} frames (via {count_method}), duration {duration:.2f}s, target FPS {fps}[/dim]")
+            console.print(f"[dim]Expected {expected_frames} frames at {fps}fps, need {total_frames} for {grid} grid[/dim]")
             
-            if video_frames > 0:
-                # Calculate how many frames we'll get at the target FPS
-                expected_frames = min(int(duration * fps), video_frames)
-                console.print(f"[dim]Video has {video_frames} frames, duration {duration:.2f}s, target FPS {fps}[/dim]")
-                console.print(f"[dim]Expected {expected_frames} frames at {fps}fps, need {total_frames} for {grid} grid[/dim]")
-                
-                if expected_frames < total_frames:
-                    console.print(f"[yellow]Warning: Will get ~{expected_frames} frames at {fps}fps but need {total_frames} for {grid} grid[/yellow]")
-                    console.print("[yellow]This may result in blank frames in the sprite sheet[/yellow]")
-        except Exception:
+            if expected_frames < total_frames:
+                console.print(f"[yellow]Warning: Will get ~{expected_frames} frames at {fps}fps but need {total_frames} for {grid} grid[/yellow]")
+                console.print("[yellow]This may result in blank frames in the sprite sheet[/yellow]")
+        else:
             console.print("[dim]Could not determine video frame count[/dim]")
         
         # For seamless looping, sample frames evenly and add the first frame at the end
@@ -159,161 +686,418 @@ def process_video_file(input_file, output, fps, size, grid, preset, loop, create
     else:
         vf = f'fps={fps},scale={size},tile={grid}'
     
-    cmd = [
-        'ffmpeg',
-        '-i', str(input_file),
-        '-vf', vf,
-        '-frames:v', '1',
-        '-y',  # Overwrite output file if it exists
-        str(output_file)
-    ]
+    # ffmpeg writes the paletted sheets itself: a single sheet gets a palette built in the same graph,
+    # while pages are mapped onto one palette from a bounded first pass (see the decode stage)
+    if palette and paginate:
+        sheet_filter = paletteuse_filter(dither)
+    elif palette:
+        sheet_filter = ',' + palette_filter(palette, dither)
+    else:
+        sheet_filter = ''
+    vf += sheet_filter
+    
+    if sampling == 'fps' and paginate:
+        # One decode pass; the tile filter emits a new sheet every cols*rows frames
+        remove_pages(output_file)
+        cmd = ['ffmpeg']
+        if max_pages:
+            cmd += ['-t', f'{sample_window(fps, grid, max_pages):.3f}']
+        cmd += ['-i', str(input_file), '-vf', vf]
+        if max_pages:
+            cmd += ['-frames:v', str(max_pages)]
+        cmd += ['-start_number', '0', '-y', str(page_pattern(output_file))]
+    elif sampling == 'fps':
+        # Only the first cols*rows frames at the target fps end up in the sheet, so
+        # stop reading the input once that window has been covered
+        cmd = tile_sheet_command(input_file, fps, size, grid, output_file, sheet_filter)
+    
+    # Settings handed through to the Pillow preview builder
+    gif_options = {'blank_thresholds': blank_thresholds, 'gif_size': gif_size, 'max_memory_mb': gif_max_memory, 'profiler': profiler}
+    
+    # In ffmpeg GIF mode the preview comes out of the same decode as the sheet
+    gif_in_graph = create_gif and gif_mode == 'ffmpeg' and sampling == 'fps' and backend == 'tile'
+    if gif_in_graph and paginate and not max_pages:
+        # palettegen holds every GIF frame until the stream ends, which --gif-max-memory can't bound
+        console.print("[yellow]--gif-mode ffmpeg needs --max-pages when paginating; building the preview from the pages[/yellow]")
+        gif_in_graph = False
+    if gif_in_graph:
+        grid_cols, grid_rows = map(int, grid.split('x'))
+        max_frames = grid_cols * grid_rows * (max_pages if paginate else 1)
+        source_size = None
+        if gif_size == 'source':
+            video_info = video_info or probe_or_none(input_file, use_cache, profiler)
+            if video_info and video_info.width and video_info.height:
+                source_size = (video_info.width, video_info.height)
+        # paletteuse holds every GIF frame as RGB32 until palettegen emits at end of stream
+        frame_size = tuple(map(int, size.split('x')))
+        (gif_width, gif_height), limited = preview_frame_size(gif_size, frame_size, source_size, max_frames + 1, gif_max_memory, 4)
+        if limited:
+            console.print(f"[yellow]Preview frames reduced to {gif_width}x{gif_height} to stay under {gif_max_memory} MB[/yellow]")
+        graph_gif_size = f'{gif_width}x{gif_height}' if limited or (gif_size == 'source' and not source_size) else gif_size
+        cmd = add_gif_output(cmd, fps, size, grid, output_file.with_suffix('.gif'), max_frames, graph_gif_size, sheet_filter)
+    
+    if sampling != 'fps':
+        # Seek sampling spreads the grid over the whole video, so it needs the duration
+        if not PIL_AVAILABLE:
+            console.print("[red]Error: Pillow is required for seek sampling[/red]")
+            return False
+        if video_info is None:
+            video_info = probe_or_none(input_file, use_cache, profiler)
+        if not (video_info and video_info.duration):
+            console.print("[red]Error: Could not determine video duration for seek sampling[/red]")
+            return False
     
     # Run ffmpeg with progress indicator
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-        transient=True
-    ) as progress:
-        task = progress.add_task("Converting video to sprite sheet...", total=None)
+    with conversion_progress(console) as progress:
+        task = progress.add_task("Converting video to sprite sheet...", total=None, speed='')
         
         try:
-            subprocess.run(cmd, capture_output=True, text=True, check=True)
+            # With the tile backend ffmpeg also encodes the PNG(s), so that time is part of 'decode'
+            with profiler.stage('decode'), ExitStack() as scratch:
+                if sampling == 'fps' and backend == 'tile' and paginate and palette:
+                    window = sample_window(fps, grid, max_pages) if max_pages else None
+                    with profiler.stage('palette'):
+                        palette_file = scratch.enter_context(first_pass_palette(input_file, size, palette, window))
+                    cmd = add_palette_input(cmd, palette_file)
+                
+                if sampling == 'fps' and backend == 'raw':
+                    if paginate:
+                        window = sample_window(fps, grid, max_pages) if max_pages else None
+                    else:
+                        window = sample_window(fps, grid)
+                    written = build_raw_sheets(input_file, output_file, fps, size, grid, paginate, max_pages, window, profiler,
+                                               palette, dither)
+                    console.print(f"[dim]Assembled {len(written)} sheet(s) from raw frames[/dim]")
+                elif sampling == 'fps' and (console.is_terminal or stall_timeout):
+                    if paginate and video_info is None:
+                        video_info = probe_or_none(input_file, use_cache, profiler)
+                    total = expected_output_seconds(fps, grid, paginate, max_pages, video_info)
+                    run_ffmpeg_with_bar(cmd if paginate else track_input_time(cmd), progress, task, total, stall_timeout)
+                elif sampling == 'fps':
+                    subprocess.run(cmd, capture_output=True, text=True, check=True)
+                else:
+                    placed = build_seek_sheet(input_file, output_file, video_info.duration, size, grid, exact=(sampling == 'seek-exact'),
+                                              profiler=profiler, palette=palette, dither=dither)
+                    console.print(f"[dim]Sampled {placed} frames by seeking across {video_info.duration:.2f}s[/dim]")
             progress.update(task, description="✓ Conversion complete!")
             
+            if sampling == 'fps' and backend == 'tile':
+                # ffmpeg only reports the sheets, so count the tiles they hold; without an earlier probe every slot counts
+                pages = len(find_pages(output_file)) if paginate else 1
+                profiler.count('tiles filled', tile_frame_count(fps, grid, pages, video_info and video_info.duration))
+            
+            if paginate:
+                return report_pages(input_file, output_file, fps, size, grid, create_gif, console, video_info, use_cache, gif_in_graph,
+                                    loop, metadata_formats, **gif_options)
+            
             # Show success message with stats
             if output_file.exists():
+                profiler.count('sheets written')
+                profiler.count('bytes written', output_file.stat().st_size)
                 size_mb = output_file.stat().st_size / (1024 * 1024)
                 console.print("[green]✓ Sprite sheet created successfully![/green]")
                 console.print(f"[dim]  File: {output_file}[/dim]")
                 console.print(f"[dim]  Size: {size_mb:.2f} MB[/dim]")
                 
+                if sampling != 'fps':
+                    grid_cols, grid_rows = map(int, grid.split('x'))
+                    timestamps = sample_timestamps(video_info.duration, grid_cols * grid_rows)
+                else:
+                    timestamps = None
+                write_sheet_metadata([output_file], output_file, input_file, fps, size, grid, loop, console, metadata_formats, timestamps,
+                                     blank_thresholds, profiler)
+                
                 # Create test GIF if requested (GIFs always loop)
                 if create_gif:
-                    gif_path = output_file.with_suffix('.gif')
-                    grid_cols, grid_rows = map(int, grid.split('x'))
-                    if create_sprite_gif(output_file, gif_path, grid_cols, grid_rows, fps, input_file, console):
-                        console.print(f"[green]✓ Test GIF created: {gif_path} (infinite loop)[/green]")
+                    finish_gif(output_file, output_file, grid, fps, input_file, console, video_info, use_cache, gif_in_graph, **gif_options)
                 
                 return True
             else:
                 console.print("[yellow]⚠ File created but couldn't verify size[/yellow]")
                 return False
                 
-        except subprocess.CalledProcessError as e:
-            progress.update(task, description="✗ Conversion failed!")
-            console.print(f"[red]Error running ffmpeg: {e}[/red]")
-            if e.stderr:
-                console.print(f"[red]ffmpeg error: {e.stderr}[/red]")
+        except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
+            report_ffmpeg_error(e, progress, task, console, profiler)
             return False
 
 
-def create_sprite_gif(sprite_path, gif_path, grid_cols, grid_rows, fps, input_file, console):
-    """Create an animated GIF from a sprite sheet to test looping."""
+def write_sheet_metadata(sheet_paths, output_file, input_file, fps, size, grid, loop, console, metadata_formats=('json',),
+                         timestamps=None, blank_thresholds=None, profiler=None):
+    """Write the frame metadata sidecar(s) for a finished sheet or set of pages.
+    
+    Blank tiles are found with the same thresholds as the preview GIF and
+    flagged in the metadata. A failure here only warns; the sheet is kept.
+    """
+    if not metadata_formats:
+        return
+    profiler = profiler or Profiler()
+    try:
+        with profiler.stage('metadata'):
+            blank = detect_blank_frames(sheet_paths, grid, blank_thresholds)
+            metadata = grid_metadata(sheet_paths, input_file, fps, size, grid, loop, timestamps, blank)
+            written = write_metadata(output_file, metadata, metadata_formats)
+    except (OSError, ValueError) as e:
+        console.print(f"[yellow]Warning: Could not write frame metadata: {e}[/yellow]")
+        return
+    console.print(f"[dim]  Metadata: {', '.join(path.name for path in written)}[/dim]")
+
+
+def preset_output_path(input_file, output, preset):
+    """Where one preset's sheet goes in a multi-preset run: output_<preset>.png, or the default name."""
+    if output:
+        return output.with_name(f"{output.stem}_{preset}{output.suffix}")
+    return default_output_path(input_file, None, None, None, preset)
+
+
+def multi_preset_command(input_file, presets, output_files, palette=0, dither='floyd-steinberg'):
+    """One ffmpeg command that decodes input_file once and writes a sheet per preset.
+    
+    The decoded stream is split before the fps filter, since presets differ in
+    frame rate, and each branch gets its own fps/scale/tile chain and output.
+    Input is capped at the longest window any preset needs. With palette,
+    each sheet gets its own palette (presets differ in size and content).
+    """
+    configs = [PRESETS[preset] for preset in presets]
+    window = max(sample_window(config['fps'], config['grid']) for config in configs)
+    graph = f'[0:v]split={len(configs)}' + ''.join(f'[in{i}]' for i in range(len(configs)))
+    for i, config in enumerate(configs):
+        sheet_filter = ',' + palette_filter(palette, dither, label=str(i)) if palette else ''
+        graph += f";[in{i}]fps={config['fps']},scale={config['size']},tile={config['grid']}{sheet_filter}[sheet{i}]"
+    
+    cmd = ['ffmpeg', '-t', f'{window:.3f}', '-i', str(input_file), '-filter_complex', graph]
+    for i, output_file in enumerate(output_files):
+        cmd += ['-map', f'[sheet{i}]', '-frames:v', '1', '-y', str(output_file)]
+    return cmd
+
+
+def process_video_presets(input_file, output, presets, loop, create_gif, console, use_cache=True, gif_mode='pillow',
+                          blank_thresholds=None, gif_size='sheet', gif_max_memory=256, stall_timeout=0, metadata_formats=('json',),
+                          palette=0, dither='floyd-steinberg', profiler=None):
+    """Build one sprite sheet per preset from a single decode of input_file.
+    
+    Preview GIFs, if requested, are always cut from the saved sheets with
+    Pillow. Returns True only if every preset's sheet was written.
+    """
+    profiler = profiler or Profiler()
+    output_files = [preset_output_path(input_file, output, preset) for preset in presets]
+    
+    config_text = Text()
+    config_text.append("Input: ", style="bold")
+    config_text.append(str(input_file), style="cyan")
+    for preset, output_file in zip(presets, output_files):
+        config = PRESETS[preset]
+        config_text.append(f"\n{preset}: ", style="bold")
+        config_text.append(f"{config['fps']}fps {config['size']} {config['grid']} → ", style="yellow")
+        config_text.append(str(output_file), style="green")
+    console.print(Panel(config_text, title="🎬 Sprite Sheet Configuration", border_style="blue"))
+    
+    if loop:
+        console.print("[dim]Note: Loop duplication will be handled during GIF creation[/dim]")
+    if create_gif and gif_mode == 'ffmpeg':
+        console.print("[yellow]--gif-mode ffmpeg is not available with multiple presets; building previews from the sheets[/yellow]")
+    
+    cmd = multi_preset_command(input_file, presets, output_files, palette, dither)
+    with conversion_progress(console) as progress:
+        task = progress.add_task(f"Converting video to {len(presets)} sprite sheets...", total=None, speed='')
+        try:
+            with profiler.stage('decode'):
+                if console.is_terminal or stall_timeout:
+                    run_ffmpeg_with_bar(cmd, progress, task, None, stall_timeout)
+                else:
+                    subprocess.run(cmd, capture_output=True, text=True, check=True)
+            progress.update(task, description="✓ Conversion complete!")
+        except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
+            report_ffmpeg_error(e, progress, task, console, profiler)
+            return False
+    
+    # Probed at most once and shared by every preset; only a source-sized preview needs it
+    video_info = probe_or_none(input_file, use_cache, profiler) if create_gif and gif_size == 'source' else None
+    
+    gif_options = {'blank_thresholds': blank_thresholds, 'gif_size': gif_size, 'max_memory_mb': gif_max_memory, 'profiler': profiler}
+    success = True
+    for preset, output_file in zip(presets, output_files):
+        if not output_file.exists():
+            console.print(f"[yellow]⚠ No sprite sheet was written for preset '{preset}'[/yellow]")
+            success = False
+            continue
+        
+        config = PRESETS[preset]
+        profiler.count('sheets written')
+        profiler.count('bytes written', output_file.stat().st_size)
+        profiler.count('tiles filled', tile_frame_count(config['fps'], config['grid'], duration=video_info and video_info.duration))
+        size_mb = output_file.stat().st_size / (1024 * 1024)
+        console.print(f"[green]✓ {preset} sprite sheet created: {output_file} ({size_mb:.2f} MB)[/green]")
+        
+        write_sheet_metadata([output_file], output_file, input_file, config['fps'], config['size'], config['grid'], loop, console,
+                             metadata_formats, None, blank_thresholds, profiler)
+        
+        if create_gif:
+            finish_gif(output_file, output_file, config['grid'], config['fps'], input_file, console, video_info, use_cache, False,
+                       **gif_options)
+    
+    return success
+
+
+def report_pages(input_file, output_file, fps, size, grid, create_gif, console, video_info, use_cache, gif_in_graph=False,
+                 loop=False, metadata_formats=('json',), **gif_options):
+    """Index the pages written by a paginated run and build the optional preview GIF."""
+    pages = find_pages(output_file)
+    if not pages:
+        console.print("[yellow]⚠ ffmpeg finished but no sprite sheet pages were written[/yellow]")
+        return False
+    
+    index_file = write_page_index(output_file, pages, input_file, fps, size, grid)
+    total_bytes = sum(page.stat().st_size for page in pages)
+    size_mb = total_bytes / (1024 * 1024)
+    
+    profiler = gif_options.get('profiler') or Profiler()
+    profiler.count('sheets written', len(pages))
+    profiler.count('bytes written', total_bytes)
+    console.print(f"[green]✓ {len(pages)} sprite sheet pages created successfully![/green]")
+    console.print(f"[dim]  Pages: {pages[0].name} … {pages[-1].name}[/dim]")
+    console.print(f"[dim]  Index: {index_file}[/dim]")
+    console.print(f"[dim]  Size: {size_mb:.2f} MB[/dim]")
+    write_sheet_metadata(pages, output_file, input_file, fps, size, grid, loop, console, metadata_formats, None,
+                         gif_options.get('blank_thresholds'), profiler)
+    
+    if create_gif:
+        finish_gif(pages, output_file, grid, fps, input_file, console, video_info, use_cache, gif_in_graph, **gif_options)
+    
+    return True
+
+
+def finish_gif(sheets, output_file, grid, fps, input_file, console, video_info, use_cache, gif_in_graph, **gif_options):
+    """Report the preview GIF, building it from the sheet(s) unless ffmpeg already wrote it."""
+    gif_path = output_file.with_suffix('.gif')
+    if gif_in_graph:
+        if gif_path.exists():
+            profiler = gif_options.get('profiler') or Profiler()
+            profiler.count('bytes written', gif_path.stat().st_size)
+            console.print(f"[green]✓ Test GIF created: {gif_path} (infinite loop, same decode pass)[/green]")
+        return
+    
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    if create_sprite_gif(sheets, gif_path, grid_cols, grid_rows, fps, input_file, console, video_info=video_info, use_cache=use_cache,
+                         **gif_options):
+        console.print(f"[green]✓ Test GIF created: {gif_path} (infinite loop)[/green]")
+
+
+def preview_frame_size(gif_size, frame_size, source_size, frame_count, max_memory_mb, bytes_per_pixel=3):
+    """Pick the preview GIF frame size and whether the memory guard had to shrink it.
+    
+    gif_size is 'sheet' (frame_size), 'source' (source_size, falling back to
+    frame_size) or 'WxH'. The size is scaled down, keeping its aspect ratio,
+    until frame_count frames of bytes_per_pixel (3 for Pillow's RGB, 4 for
+    ffmpeg's RGB32) fit in max_memory_mb (0 = no limit).
+    """
+    if gif_size == 'sheet':
+        width, height = frame_size
+    elif gif_size == 'source':
+        width, height = source_size or frame_size
+    else:
+        width, height = map(int, gif_size.split('x'))
+    
+    if max_memory_mb:
+        budget = max_memory_mb * 1024 * 1024
+        needed = frame_count * width * height * bytes_per_pixel
+        if needed > budget:
+            scale = (budget / needed) ** 0.5
+            return (max(1, int(width * scale)), max(1, int(height * scale))), True
+    return (width, height), False
+
+
+def create_sprite_gif(sprite_path, gif_path, grid_cols, grid_rows, fps, input_file, console, video_info=None, use_cache=True,
+                      blank_thresholds=None, gif_size='sheet', max_memory_mb=256, profiler=None):
+    """Create an animated GIF from a sprite sheet (or a list of page sheets) to test looping.
+    
+    Frames keep the sheet's tile size by default; gif_size='source' scales them
+    to the video resolution (probing only then, reusing video_info if given)
+    and 'WxH' to a fixed size. Frames are streamed into the GIF as they are
+    cut, so memory does not grow with the frame count; they are shrunk only
+    if the few frames held at once would need more than max_memory_mb of RGB
+    data (0 = no limit). Tiles matching blank_thresholds (a BlankThresholds,
+    default if None) are skipped. Stage times go to profiler, if given.
+    """
+    profiler = profiler or Profiler()
     if not PIL_AVAILABLE:
         console.print("[yellow]Warning: Pillow not installed, cannot create test GIF[/yellow]")
         return False
         
     try:
-        # Get original video resolution
-        try:
-            probe_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_entries', 'stream=width,height', str(input_file)]
-            result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
-            streams = json.loads(result.stdout)['streams']
-            video_stream = next((s for s in streams if 'width' in s and 'height' in s), None)
-            if video_stream:
-                original_width = video_stream['width']
-                original_height = video_stream['height']
-                console.print(f"[dim]Original video resolution: {original_width}x{original_height}[/dim]")
-            else:
-                # Fallback to sprite frame size if can't detect
-                original_width = original_height = None
-        except Exception:
-            original_width = original_height = None
+        # Only a source-sized preview needs the original video resolution
+        source_size = None
+        if gif_size == 'source':
+            if video_info is None:
+                video_info = probe_or_none(input_file, use_cache, profiler)
+            if video_info and video_info.width and video_info.height:
+                source_size = (video_info.width, video_info.height)
+                console.print(f"[dim]Original video resolution: {video_info.width}x{video_info.height}[/dim]")
         
-        # Open the sprite sheet
-        sprite_sheet = Image.open(sprite_path)
-        width, height = sprite_sheet.size
+        # A paginated run passes every page; frames are taken from each in order
+        sheet_paths = sprite_path if isinstance(sprite_path, (list, tuple)) else [sprite_path]
+        target_size = None
         
-        # Calculate frame dimensions
-        frame_width = width // grid_cols
-        frame_height = height // grid_rows
-        
-        frames = []
+        # Calculate frame duration in milliseconds (1000ms / fps)
+        frame_duration = int(1000 / fps)
         
-        # Extract each frame from the sprite sheet
-        for row in range(grid_rows):
-            for col in range(grid_cols):
-                left = col * frame_width
-                top = row * frame_height
-                right = left + frame_width
-                bottom = top + frame_height
-                
-                frame = sprite_sheet.crop((left, top, right, bottom))
-                
-                # Check if frame is blank/empty and skip it
-                frame_rgb = frame.convert('RGB')
-                
-                # For more robust blank frame detection, check multiple pixels
-                pixels_to_check = [
-                    (frame_width//2, frame_height//2),  # center
-                    (min(10, frame_width-1), min(10, frame_height-1)),  # top-left
-                    (frame_width-min(10, frame_width-1), min(10, frame_height-1)),  # top-right
-                    (min(10, frame_width-1), frame_height-min(10, frame_height-1)),  # bottom-left
-                    (frame_width-min(10, frame_width-1), frame_height-min(10, frame_height-1)),  # bottom-right
-                    (frame_width//4, frame_height//4),  # quarter points
-                    (3*frame_width//4, 3*frame_height//4)
-                ]
-                
-                # Count blank/black pixels
-                blank_pixel_count = 0
-                total_brightness = 0
-                
-                for px, py in pixels_to_check:
-                    if px < frame_width and py < frame_height:
-                        pixel = frame_rgb.getpixel((px, py))
-                        # Check for black pixels
-                        if pixel == (0, 0, 0):
-                            blank_pixel_count += 1
-                        # Calculate brightness (for very dark/blank frames)
-                        brightness = sum(pixel) / 3
-                        total_brightness += brightness
+        # Frames are encoded as they are cut from the sheet instead of being collected
+        with StreamingGifWriter(gif_path, frame_duration, loop=0) as writer:  # 0 means infinite loop
+            first_frame = None
+            
+            for sheet_path in sheet_paths:
+                # Open the sprite sheet
+                with profiler.stage('gif sheet load'):
+                    sprite_sheet = Image.open(sheet_path)
+                    sprite_sheet.load()
+                width, height = sprite_sheet.size
                 
-                avg_brightness = total_brightness / len(pixels_to_check)
-                blank_percentage = blank_pixel_count / len(pixels_to_check)
+                # Calculate frame dimensions
+                frame_width = width // grid_cols
+                frame_height = height // grid_rows
                 
-                # Skip if frame appears to be blank/empty
-                # Either too many black pixels OR very low average brightness
-                if blank_percentage >= 0.6 or avg_brightness < 10:
-                    console.print(f"[dim]Skipping blank frame at position {row},{col} (blank: {blank_percentage:.1%}, brightness: {avg_brightness:.1f})[/dim]")
-                    continue
+                if target_size is None:
+                    # Frames are streamed, so only the current frame, its paletted copy
+                    # and the first frame (kept for the loop) are in memory at once
+                    target_size, limited = preview_frame_size(gif_size, (frame_width, frame_height), source_size, 3, max_memory_mb)
+                    if limited:
+                        console.print(f"[yellow]Preview frames reduced to {target_size[0]}x{target_size[1]} to stay under {max_memory_mb} MB[/yellow]")
                 
-                # Scale frame to original video resolution if available
-                if original_width and original_height:
-                    frame = frame.resize((original_width, original_height), Image.LANCZOS)
+                # Find blank tiles for the whole sheet in one pass
+                with profiler.stage('gif blank detection'):
+                    blank_tiles, (means, _, variances) = find_blank_tiles(sprite_sheet, grid_cols, grid_rows, blank_thresholds)
                 
-                frames.append(frame)
-        
-        # Always ensure smooth looping by adding the first frame at the end
-        # This creates a seamless transition back to the beginning
-        if len(frames) > 1:
-            frames.append(frames[0])
-            console.print(f"[dim]Added first frame at end for seamless GIF loop ({len(frames)} total frames)[/dim]")
-        
-        # Calculate frame duration in milliseconds (1000ms / fps)
-        frame_duration = int(1000 / fps)
+                # Extract each frame from the sprite sheet
+                for row in range(grid_rows):
+                    for col in range(grid_cols):
+                        # Skip if frame appears to be blank/empty
+                        if blank_tiles[row][col]:
+                            console.print(f"[dim]Skipping blank frame at position {row},{col} (brightness: {means[row][col]:.1f}, variance: {variances[row][col]:.1f})[/dim]")
+                            continue
+                        
+                        left = col * frame_width
+                        top = row * frame_height
+                        frame = sprite_sheet.crop((left, top, left + frame_width, top + frame_height))
+                        
+                        # Scale frame to the requested preview size
+                        if target_size != frame.size:
+                            frame = frame.resize(target_size, Image.LANCZOS)
+                        
+                        if first_frame is None:
+                            first_frame = frame
+                        with profiler.stage('gif encode'):
+                            writer.add_frame(frame)
+            
+            # Always ensure smooth looping by adding the first frame at the end
+            # This creates a seamless transition back to the beginning
+            if writer.frame_count > 1:
+                with profiler.stage('gif encode'):
+                    writer.add_frame(first_frame)
+                console.print(f"[dim]Added first frame at end for seamless GIF loop ({writer.frame_count} total frames)[/dim]")
         
-        # Save as animated GIF
-        if frames:
-            frames[0].save(
-                gif_path,
-                save_all=True,
-                append_images=frames[1:],
-                duration=frame_duration,
-                loop=0  # 0 means infinite loop
-            )
-            return True
-        return False
+        profiler.count('gif frames', writer.frame_count)
+        if gif_path.exists():
+            profiler.count('bytes written', gif_path.stat().st_size)
+        return writer.frame_count > 0
         
     except Exception as e:
         console.print(f"[yellow]Warning: Could not create test GIF: {e}[/yellow]")
@@ -0,0 +1,85 @@
+# ABOUTME: Build manifest for --incremental runs: fingerprints of finished jobs per output directory
+# ABOUTME: A job is skipped when its input identity and parameters match and its outputs still exist
+
+import hashlib
+import json
+import os
+import threading
+
+from spriter.cache import file_identity
+
+MANIFEST_NAME = '.spriter-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def job_fingerprint(input_file, params):
+    """Hash of the input's path, size and mtime plus every parameter that shapes the outputs."""
+    path, size, mtime_ns = file_identity(input_file)
+    payload = json.dumps({'version': MANIFEST_VERSION, 'input': [path, size, mtime_ns], 'params': params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Manifest:
+    """Fingerprints of finished jobs, kept in a .spriter-manifest.json next to their outputs.
+
+    Each directory's manifest is read once and held in memory, so checking a
+    large library costs one JSON load per directory plus a stat per output.
+    Records are written back every flush_every jobs and on flush(); writes
+    are atomic and best effort, like the probe cache. Safe to share between
+    worker threads.
+    """
+
+    def __init__(self, flush_every=100):
+        self.flush_every = flush_every
+        self._entries = {}
+        self._dirty = set()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _load(self, directory):
+        if directory not in self._entries:
+            try:
+                data = json.loads((directory / MANIFEST_NAME).read_text())
+                entries = data['entries'] if data.get('version') == MANIFEST_VERSION else {}
+            except (OSError, ValueError, KeyError, AttributeError):
+                entries = {}
+            self._entries[directory] = entries
+        return self._entries[directory]
+
+    def is_current(self, output_file, fingerprint):
+        """True if output_file was recorded with this fingerprint and every output it listed still exists."""
+        with self._lock:
+            entry = self._load(output_file.parent).get(output_file.name)
+        if not entry or entry.get('fingerprint') != fingerprint:
+            return False
+        return all((output_file.parent / name).exists() for name in entry.get('outputs', []))
+
+    def record(self, output_file, fingerprint, outputs):
+        """Remember that the job writing output_file (and the other paths in outputs) finished."""
+        directory = output_file.parent
+        with self._lock:
+            self._load(directory)[output_file.name] = {
+                'fingerprint': fingerprint,
+                'outputs': sorted({os.path.relpath(path, directory) for path in outputs})
+            }
+            self._dirty.add(directory)
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        for directory in self._dirty:
+            path = directory / MANIFEST_NAME
+            temp_path = path.with_name(path.name + '.part')
+            try:
+                temp_path.write_text(json.dumps({'version': MANIFEST_VERSION, 'entries': self._entries[directory]}, indent=1))
+                os.replace(temp_path, path)
+            except OSError:
+                pass
+        self._dirty.clear()
+        self._pending = 0
@@ -0,0 +1,148 @@
+# ABOUTME: Frame metadata sidecars for sheets and atlases: rects, timestamps, loop flag and blank frames
+# ABOUTME: Written as spriter's generic JSON and as TexturePacker-style hash or array documents
+
+import json
+
+try:
+    from PIL import Image
+    from spriter.blank import find_blank_tiles
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+METADATA_VERSION = 1
+METADATA_FORMATS = ('json', 'texturepacker-hash', 'texturepacker-array')
+
+
+def frame_entry(page, x, y, width, height, offset=(0, 0), source_size=None, **extra):
+    """One frame's rect on its page, plus where it sits in the untrimmed source frame."""
+    source_width, source_height = source_size or (width, height)
+    return {
+        'page': page, 'x': x, 'y': y, 'w': width, 'h': height,
+        'offset_x': offset[0], 'offset_y': offset[1], 'source_w': source_width, 'source_h': source_height,
+        **extra
+    }
+
+
+def sheet_metadata(pages, animations, fps, frame_size, **fields):
+    """The generic sidecar document shared by grid sheets and atlases.
+
+    pages is a list of (image path, (width, height)) and animations maps each
+    animation name to {'source': ..., 'frames': [frame_entry(...), ...]} with
+    frames in playback order. Extra fields (grid, loop, trimmed, ...) go at
+    the top level.
+    """
+    return {
+        'version': METADATA_VERSION,
+        'fps': fps,
+        'frame_duration_ms': round(1000 / fps, 3),
+        'frame_size': frame_size,
+        **fields,
+        'pages': [{'image': path.name, 'width': width, 'height': height} for path, (width, height) in pages],
+        'animations': animations
+    }
+
+
+def detect_blank_frames(sheet_paths, grid, thresholds=None):
+    """Per-page rows x cols grids marking blank tiles, or None without Pillow."""
+    if not PIL_AVAILABLE:
+        return None
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    blank = []
+    for sheet_path in sheet_paths:
+        with Image.open(sheet_path) as sheet:
+            blank.append(find_blank_tiles(sheet, grid_cols, grid_rows, thresholds)[0])
+    return blank
+
+
+def grid_metadata(sheet_paths, input_file, fps, size, grid, loop=False, timestamps=None, blank=None):
+    """Sidecar document for one or more grid sheets of a single video.
+
+    Tiles are numbered row-major across pages. A tile's time is k/fps unless
+    timestamps (seek sampling) are given. blank, from detect_blank_frames,
+    flags the tiles a player should skip, the same ones the preview GIF drops.
+    """
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    frame_width, frame_height = map(int, size.split('x'))
+    frames = []
+    for page in range(len(sheet_paths)):
+        for slot in range(grid_cols * grid_rows):
+            index = page * grid_cols * grid_rows + slot
+            row, col = divmod(slot, grid_cols)
+            time = timestamps[index] if timestamps else index / fps
+            frames.append(frame_entry(page, col * frame_width, row * frame_height, frame_width, frame_height,
+                                      time=round(time, 3), blank=bool(blank and blank[page][row][col])))
+
+    sheet_size = (grid_cols * frame_width, grid_rows * frame_height)
+    return sheet_metadata(
+        [(path, sheet_size) for path in sheet_paths],
+        {input_file.stem: {'source': str(input_file), 'frames': frames}},
+        fps, size,
+        grid=grid,
+        loop=loop,
+        blank_frames=[index for index, frame in enumerate(frames) if frame['blank']]
+    )
+
+
+def texturepacker_document(metadata, page, layout='hash'):
+    """A TexturePacker-style JSON document for one page of a sidecar document.
+
+    layout 'hash' keys frames by name, 'array' lists them with a 'filename'.
+    Frames are named <animation>_<index>, blank frames are left out, and
+    each animation's frames on the page are also listed as a frameTags
+    range (the Aseprite extension most loaders understand).
+    """
+    frames = []
+    tags = []
+    for name, animation in metadata['animations'].items():
+        first = len(frames)
+        for index, frame in enumerate(animation['frames']):
+            if frame['page'] != page or frame.get('blank'):
+                continue
+            frames.append((f'{name}_{index:04d}', {
+                'frame': {'x': frame['x'], 'y': frame['y'], 'w': frame['w'], 'h': frame['h']},
+                'rotated': False,
+                'trimmed': (frame['w'], frame['h']) != (frame['source_w'], frame['source_h']),
+                'spriteSourceSize': {'x': frame['offset_x'], 'y': frame['offset_y'], 'w': frame['w'], 'h': frame['h']},
+                'sourceSize': {'w': frame['source_w'], 'h': frame['source_h']},
+                'duration': round(metadata['frame_duration_ms'])
+            }))
+        if len(frames) > first:
+            tags.append({'name': name, 'from': first, 'to': len(frames) - 1, 'direction': 'forward'})
+
+    image = metadata['pages'][page]
+    meta = {
+        'app': 'spriter',
+        'version': str(METADATA_VERSION),
+        'image': image['image'],
+        'format': 'RGBA8888',
+        'size': {'w': image['width'], 'h': image['height']},
+        'scale': '1',
+        'frameTags': tags
+    }
+    if layout == 'hash':
+        return {'frames': dict(frames), 'meta': meta}
+    return {'frames': [{'filename': name, **frame} for name, frame in frames], 'meta': meta}
+
+
+def write_metadata(output_file, metadata, formats=('json',)):
+    """Write the sidecar document in each requested format. Returns the paths written.
+
+    'json' goes to output_file with a .json suffix. The TexturePacker formats
+    are written per page, next to each page image, as <image>.tp-hash.json
+    or <image>.tp-array.json.
+    """
+    written = []
+    for metadata_format in formats:
+        if metadata_format == 'json':
+            documents = [(output_file.with_suffix('.json'), metadata)]
+        else:
+            layout = metadata_format.removeprefix('texturepacker-')
+            documents = [
+                (output_file.with_name(page['image']).with_suffix(f'.tp-{layout}.json'), texturepacker_document(metadata, index, layout))
+                for index, page in enumerate(metadata['pages'])
+            ]
+        for path, document in documents:
+            path.write_text(json.dumps(document, indent=2))
+            written.append(path)
+    return written
@@ -0,0 +1,103 @@
+# ABOUTME: Helpers for tile-filter sprite sheets: the sample window and ffmpeg command shared by CLI and API
+# ABOUTME: Names page files (name_0.png, name_1.png, ...) and writes the JSON page index
+
+import json
+import math
+import re
+
+
+def sample_window(fps, grid, pages=1):
+    """Seconds of source video the fps filter needs to fill every tile in the grid.
+
+    Frame k is taken at k/fps, so cols*rows frames need (cols*rows - 1)/fps
+    seconds; one extra frame interval of slack covers the fps filter's rounding.
+    """
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    return (grid_cols * grid_rows * pages + 1) / fps
+
+
+def tile_frame_count(fps, grid, pages=1, duration=None):
+    """Source frames the tile filter placed on pages sheets.
+
+    Every tile is filled unless the source runs out first (the tile filter
+    pads the rest with blank tiles); without a duration every tile counts.
+    """
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    slots = grid_cols * grid_rows * pages
+    return min(slots, math.ceil(duration * fps)) if duration else slots
+
+
+def tile_sheet_command(input_file, fps, size, grid, output='-', sheet_filter=''):
+    """ffmpeg command that tiles the first cols*rows sampled frames into one sheet.
+
+    The input is capped at sample_window so decoding stops once every tile is
+    filled. output '-' writes the PNG to stdout, anything else is a file path
+    to overwrite. sheet_filter is appended after tile= (e.g. ',' + palette_filter(...)).
+    """
+    cmd = ['ffmpeg', '-v', 'error'] if output == '-' else ['ffmpeg']
+    cmd += [
+        '-t', f'{sample_window(fps, grid):.3f}',  # Input-side cap: demux/decode no further than needed
+        '-i', str(input_file),
+        '-vf', f'fps={fps},scale={size},tile={grid}{sheet_filter}',
+        '-frames:v', '1'
+    ]
+    if output == '-':
+        return cmd + ['-f', 'image2pipe', '-c:v', 'png', '-']
+    return cmd + ['-y', str(output)]
+
+
+def page_pattern(output_file):
+    """ffmpeg image2 output pattern for the pages of output_file (name_%d.png)."""
+    return output_file.with_name(f"{output_file.stem}_%d{output_file.suffix}")
+
+
+def page_path(output_file, index):
+    """Path of page number index for output_file (name_<index>.png)."""
+    return output_file.with_name(f"{output_file.stem}_{index}{output_file.suffix}")
+
+
+def index_path(output_file):
+    return output_file.with_name(f"{output_file.stem}_index.json")
+
+
+def find_pages(output_file):
+    """Return the existing page files for output_file in page order."""
+    page_re = re.compile(rf"^{re.escape(output_file.stem)}_(\d+){re.escape(output_file.suffix)}$")
+    pages = []
+    if output_file.parent.is_dir():
+        for path in output_file.parent.iterdir():
+            match = page_re.match(path.name)
+            if match:
+                pages.append((int(match.group(1)), path))
+    return [path for _, path in sorted(pages)]
+
+
+def remove_pages(output_file):
+    """Delete pages left over from a previous run so they can't be mistaken for new ones."""
+    for path in find_pages(output_file):
+        path.unlink()
+
+
+def write_page_index(output_file, pages, input_file, fps, size, grid):
+    """Write name_index.json listing every page with its first frame and start time."""
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    frames_per_page = grid_cols * grid_rows
+    index = {
+        'source': str(input_file),
+        'fps': fps,
+        'size': size,
+        'grid': grid,
+        'frames_per_page': frames_per_page,
+        'pages': [
+            {
+                'index': i,
+                'file': page.name,
+                'first_frame': i * frames_per_page,
+                'start_time': round(i * frames_per_page / fps, 3)
+            }
+            for i, page in enumerate(pages)
+        ]
+    }
+    path = index_path(output_file)
+    path.write_text(json.dumps(index, indent=2))
+    return path
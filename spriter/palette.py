@@ -0,0 +1,142 @@
+# ABOUTME: Indexed-palette (8-bit) PNG output: one shared palette per sheet, page set or atlas
+# ABOUTME: ffmpeg palettegen/paletteuse for the tile backend and page sets, Pillow quantization everywhere else
+
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+DITHER_MODES = ('floyd-steinberg', 'none')
+
+# Above this many pixels, palette statistics are gathered from a nearest-neighbour
+# sample of the images (which keeps exact colors) instead of every pixel
+PALETTE_SAMPLE_PIXELS = 16 * 1024 * 1024
+
+
+def _ffmpeg_dither(dither):
+    return 'floyd_steinberg' if dither == 'floyd-steinberg' else 'none'
+
+
+def palette_filter(colors, dither='floyd-steinberg', label=''):
+    """ffmpeg filter chain to append after tile= that writes one paletted (pal8) sheet.
+
+    palettegen only emits its palette once the stream ends, so paletteuse
+    holds every sheet until then: use it for single sheets only, and
+    paletteuse_filter for page sets. label keeps the pad names unique when
+    several chains share one graph.
+    """
+    return (
+        f'split[sheet_colors{label}][sheet_stats{label}];'
+        f'[sheet_stats{label}]palettegen=max_colors={colors}:reserve_transparent=0[sheet_palette{label}];'
+        f'[sheet_colors{label}][sheet_palette{label}]paletteuse=dither={_ffmpeg_dither(dither)}'
+    )
+
+
+def paletteuse_filter(dither='floyd-steinberg'):
+    """Filter chain to append after tile= that maps each page onto the palette fed in as input 1.
+
+    Pages are written as soon as they fill. The command needs
+    add_palette_input once the palette file exists.
+    """
+    return f'[sheet_tiles];[sheet_tiles][1:v]paletteuse=dither={_ffmpeg_dither(dither)}'
+
+
+def palette_command(input_file, size, colors, palette_file, window=None):
+    """ffmpeg command for the first pass of a page set: one palette PNG from the source's keyframes.
+
+    Only keyframes are decoded (-skip_frame nokey), and palettegen keeps a
+    color histogram rather than frames, so the pass stays cheap and its
+    memory flat however long the input is.
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-skip_frame', 'nokey']
+    if window:
+        cmd += ['-t', f'{window:.3f}']
+    cmd += [
+        '-i', str(input_file),
+        '-vf', f'scale={size},palettegen=max_colors={colors}:reserve_transparent=0',
+        '-frames:v', '1',
+        '-y', str(palette_file)
+    ]
+    return cmd
+
+
+@contextmanager
+def first_pass_palette(input_file, size, colors, window=None):
+    """Run palette_command into a scratch directory and yield the palette file's path.
+
+    The file is removed on exit. Raises subprocess.CalledProcessError if
+    ffmpeg fails.
+    """
+    with tempfile.TemporaryDirectory(prefix='spriter-palette-') as scratch:
+        palette_file = Path(scratch) / 'palette.png'
+        subprocess.run(palette_command(input_file, size, colors, palette_file, window), capture_output=True, text=True, check=True)
+        yield palette_file
+
+
+def add_palette_input(cmd, palette_file):
+    """Feed palette_file to a paletteuse_filter command as input 1.
+
+    A -vf chain can't reference a second input, so it becomes a
+    -filter_complex graph over [0:v].
+    """
+    after_input = cmd.index('-i') + 2
+    cmd = cmd[:after_input] + ['-i', str(palette_file)] + cmd[after_input:]
+    if '-vf' in cmd:
+        vf_index = cmd.index('-vf')
+        cmd[vf_index:vf_index + 2] = ['-filter_complex', f'[0:v]{cmd[vf_index + 1]}']
+    return cmd
+
+
+def load_palette(palette_file, colors):
+    """The first colors entries of a palettegen PNG as a 'P' image for to_indexed."""
+    with Image.open(palette_file) as image:
+        entries = image.convert('RGB').tobytes()[:colors * 3]
+    palette = Image.new('P', (1, 1))
+    palette.putpalette(entries)
+    return palette
+
+
+def shared_palette(images, colors, transparent=False):
+    """Median-cut palette of at most colors entries built from all images together.
+
+    With transparent, one entry is held back for to_indexed's transparent
+    index. Returns a 'P' image for Image.quantize(palette=...).
+    """
+    colors = colors - 1 if transparent else colors
+    total = sum(image.width * image.height for image in images)
+    scale = min(1.0, (PALETTE_SAMPLE_PIXELS / total) ** 0.5) if total else 1.0
+    samples = [image.convert('RGB') for image in images]
+    if scale < 1.0:
+        samples = [sample.resize((max(1, int(sample.width * scale)), max(1, int(sample.height * scale))), Image.Resampling.NEAREST)
+                   for sample in samples]
+
+    montage = Image.new('RGB', (max(sample.width for sample in samples), sum(sample.height for sample in samples)))
+    top = 0
+    for sample in samples:
+        montage.paste(sample, (0, top))
+        top += sample.height
+    return montage.quantize(colors, method=Image.Quantize.MEDIANCUT)
+
+
+def to_indexed(image, palette, dither='floyd-steinberg'):
+    """Map image onto palette (from shared_palette), returning a 'P' image ready to save.
+
+    RGBA images get 1-bit transparency: pixels under half opacity use an
+    extra palette index recorded in info['transparency'], which PNG saves as
+    a tRNS chunk.
+    """
+    mode = Image.Dither.FLOYDSTEINBERG if dither == 'floyd-steinberg' else Image.Dither.NONE
+    indexed = image.convert('RGB').quantize(palette=palette, dither=mode)
+    if image.mode == 'RGBA':
+        entries = indexed.getpalette()
+        transparent = len(entries) // 3
+        indexed.putpalette(entries + [0, 0, 0])
+        indexed.paste(transparent, mask=image.getchannel('A').point(lambda value: 255 if value < 128 else 0))
+        indexed.info['transparency'] = transparent
+    return indexed
@@ -0,0 +1,158 @@
+# ABOUTME: Single-call ffprobe wrapper that collects video stream metadata
+# ABOUTME: Returns a VideoInfo object that is passed down the pipeline instead of re-probing
+
+import json
+import subprocess
+from dataclasses import asdict, dataclass
+
+from spriter.cache import cache_get, cache_put
+
+
+@dataclass(frozen=True)
+class VideoInfo:
+    """Metadata for the first video stream of a file (None where ffprobe had no answer)."""
+    duration: float | None = None
+    frame_count: int | None = None
+    width: int | None = None
+    height: int | None = None
+    frame_rate: float | None = None
+    codec: str | None = None
+    pix_fmt: str | None = None
+
+
+def parse_frame_rate(rate):
+    """Convert an ffprobe rate such as '30000/1001' into frames per second."""
+    try:
+        num, _, den = str(rate).partition('/')
+        value = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value if value > 0 else None
+
+
+def _to_int(value):
+    return int(value) if str(value).isdigit() else None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_probe_output(stdout):
+    """Build a VideoInfo from ffprobe's JSON output."""
+    data = json.loads(stdout or '{}')
+    stream = next(iter(data.get('streams') or []), {})
+    fmt = data.get('format') or {}
+
+    # Prefer a decoded count when -count_frames was used, then the container header
+    frame_count = _to_int(stream.get('nb_read_frames')) or _to_int(stream.get('nb_frames'))
+
+    return VideoInfo(
+        duration=_to_float(fmt.get('duration')) or _to_float(stream.get('duration')),
+        frame_count=frame_count,
+        width=stream.get('width'),
+        height=stream.get('height'),
+        frame_rate=parse_frame_rate(stream.get('avg_frame_rate')) or parse_frame_rate(stream.get('r_frame_rate')),
+        codec=stream.get('codec_name'),
+        pix_fmt=stream.get('pix_fmt'),
+    )
+
+
+def probe_command(input_file, count_frames=False):
+    """The single ffprobe command behind probe_video."""
+    cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-select_streams', 'v:0']
+    if count_frames:
+        cmd.append('-count_frames')
+    cmd += [
+        '-show_entries',
+        'format=duration:stream=width,height,nb_frames,nb_read_frames,avg_frame_rate,r_frame_rate,codec_name,pix_fmt,duration',
+        str(input_file)
+    ]
+    return cmd
+
+
+def cached_probe(input_file, count_frames=False):
+    """The cached VideoInfo for input_file, or None if it has not been probed since it last changed."""
+    cached = cache_get(input_file, 'probe-counted' if count_frames else 'probe')
+    return VideoInfo(**cached) if cached is not None else None
+
+
+def store_probe(input_file, count_frames, info):
+    """Cache a probe result under the entry cached_probe reads."""
+    cache_put(input_file, 'probe-counted' if count_frames else 'probe', asdict(info))
+
+
+def probe_video(input_file, count_frames=False, use_cache=True):
+    """Probe a video once for duration, frame count, resolution, frame rate, codec and pixel format.
+
+    With count_frames=True ffprobe decodes the whole stream to get an exact
+    frame count; otherwise the count comes from the container header and may
+    be None. Results are read from and written to the on-disk probe cache
+    unless use_cache=False. Raises subprocess.CalledProcessError or
+    FileNotFoundError if ffprobe fails or is missing.
+    """
+    if use_cache:
+        cached = cached_probe(input_file, count_frames)
+        if cached is not None:
+            return cached
+    
+    cmd = probe_command(input_file, count_frames)
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    info = parse_probe_output(result.stdout)
+    
+    if use_cache:
+        store_probe(input_file, count_frames, info)
+    return info
+
+
+def count_packets(input_file, use_cache=True):
+    """Count video packets by demuxing only (no decode). Returns None if unavailable."""
+    if use_cache:
+        cached = cache_get(input_file, 'packets')
+        if cached is not None:
+            return cached
+    
+    cmd = ['ffprobe', '-v', 'quiet', '-select_streams', 'v:0', '-count_packets',
+           '-show_entries', 'stream=nb_read_packets', '-of', 'csv=p=0', str(input_file)]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    packets = _to_int(result.stdout.strip().rstrip(','))
+    
+    if use_cache and packets:
+        cache_put(input_file, 'packets', packets)
+    return packets
+
+
+def estimate_frame_count(input_file, video_info, allow_decode=False, use_cache=True):
+    """Find a video's frame count using the cheapest method that works.
+    
+    Tries, in order: the container header's nb_frames, packet counting
+    (demux only), duration x average frame rate, and - only when
+    allow_decode=True - a full decode with -count_frames. Returns a
+    (frame_count, method) tuple where method is 'header', 'packets',
+    'estimate' or 'decode'; both are None if every method failed.
+    """
+    if video_info and video_info.frame_count:
+        return video_info.frame_count, 'header'
+    
+    try:
+        packets = count_packets(input_file, use_cache=use_cache)
+    except Exception:
+        packets = None
+    if packets:
+        return packets, 'packets'
+    
+    if video_info and video_info.duration and video_info.frame_rate:
+        return round(video_info.duration * video_info.frame_rate), 'estimate'
+    
+    if allow_decode:
+        try:
+            decoded = probe_video(input_file, count_frames=True, use_cache=use_cache).frame_count
+        except Exception:
+            decoded = None
+        if decoded:
+            return decoded, 'decode'
+    
+    return None, None
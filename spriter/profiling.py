@@ -0,0 +1,86 @@
+# ABOUTME: Stage timers and counters behind the --profile report
+# ABOUTME: Stages record self time (nested stages are subtracted) so the breakdown adds up
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from rich.table import Table
+
+
+class Profiler:
+    """Accumulate per-stage wall time and named counters across files and worker threads.
+
+    Wrap work in ``with profiler.stage('decode'):``. A stage's time excludes
+    any stage nested inside it on the same thread, so a decode that also
+    writes PNGs reports the PNG writing under its own stage only. Counters
+    are plain sums (frames decoded, bytes written, ...).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)  # time spent in nested stages
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                seconds, calls = self.stages.get(name, (0.0, 0))
+                self.stages[name] = (seconds + elapsed - nested, calls + 1)
+
+    def iterate(self, name, iterable):
+        """Yield from iterable, timing each step as stage name (for lazily produced work lists)."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        """The profile as a JSON-serialisable dict."""
+        with self._lock:
+            return {
+                'wall_seconds': round(time.perf_counter() - self._start, 6),
+                'stages': {name: {'seconds': round(seconds, 6), 'calls': calls} for name, (seconds, calls) in self.stages.items()},
+                'counters': dict(self.counters)
+            }
+
+    def table(self):
+        """A rich Table with one row per stage (slowest first) followed by the counters."""
+        report = self.report()
+        stage_total = sum(stage['seconds'] for stage in report['stages'].values()) or 1.0
+
+        table = Table(title='⏱ Profile', caption=f"Wall clock: {report['wall_seconds']:.3f}s")
+        table.add_column('Stage')
+        table.add_column('Calls', justify='right')
+        table.add_column('Seconds', justify='right')
+        table.add_column('Share', justify='right')
+        for name, stage in sorted(report['stages'].items(), key=lambda item: -item[1]['seconds']):
+            table.add_row(name, str(stage['calls']), f"{stage['seconds']:.3f}", f"{stage['seconds'] / stage_total:.1%}")
+        if report['counters']:
+            table.add_section()
+            for name, value in report['counters'].items():
+                table.add_row(f'[dim]{name}[/dim]', '', f'{value:,}', '')
+        return table
+
+    def write_json(self, path):
+        path.write_text(json.dumps(self.report(), indent=2))
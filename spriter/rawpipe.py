@@ -0,0 +1,147 @@
+# ABOUTME: Raw-frame pipe backend: ffmpeg streams scaled RGB frames to stdout
+# ABOUTME: Frames are copied straight into tile slots of preallocated NumPy sheets
+
+import subprocess
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from spriter.pages import page_path
+from spriter.palette import first_pass_palette, load_palette, shared_palette, to_indexed
+from spriter.profiling import Profiler
+
+
+def build_raw_command(input_file, fps, size, window=None, pix_fmt='rgb24'):
+    """ffmpeg command that writes fps-sampled, scaled frames as raw pixels to stdout."""
+    cmd = ['ffmpeg', '-v', 'error']
+    if window:
+        cmd += ['-t', f'{window:.3f}']
+    cmd += [
+        '-i', str(input_file),
+        '-vf', f'fps={fps},scale={size}',
+        '-f', 'rawvideo',
+        '-pix_fmt', pix_fmt,
+        '-'
+    ]
+    return cmd
+
+
+def _read_exact(stream, view):
+    """Fill view from stream, returning the number of bytes read (short only at EOF)."""
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def fill_raw_frames(cmd, view, max_frames=None):
+    """Run a raw-video ffmpeg command, filling view with one frame at a time.
+
+    Yields the running frame count each time view holds a complete frame;
+    the caller must copy it out before asking for the next one. ffmpeg is
+    killed as soon as max_frames have been read. Raises
+    subprocess.CalledProcessError if ffmpeg fails before producing any frame.
+    """
+    count = 0
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while max_frames is None or count < max_frames:
+            if _read_exact(process.stdout, view) < len(view):
+                break
+            count += 1
+            yield count
+    finally:
+        if process.poll() is None:
+            process.kill()
+        _, stderr = process.communicate()
+
+    if count == 0 and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr.decode(errors='replace'))
+
+
+def iter_raw_frames(input_file, fps, size, window=None, max_frames=None, channels=3):
+    """Yield decoded frames as (height, width, channels) uint8 arrays.
+
+    The same buffer is reused for every frame, so copy it before asking for
+    the next one. See fill_raw_frames for early stopping and errors.
+    """
+    width, height = map(int, size.split('x'))
+    cmd = build_raw_command(input_file, fps, size, window, 'rgba' if channels == 4 else 'rgb24')
+    frame = np.empty((height, width, channels), dtype=np.uint8)
+    for _ in fill_raw_frames(cmd, memoryview(frame).cast('B'), max_frames):
+        yield frame
+
+
+def assemble_sheets(frames, grid, size, channels=3):
+    """Copy frames into preallocated sheet arrays, yielding (sheet, frame_count) per full or final page.
+
+    Each frame is written into a view of its tile slot, so no per-tile
+    images or intermediate copies are created.
+    """
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    frame_width, frame_height = map(int, size.split('x'))
+    per_sheet = grid_cols * grid_rows
+
+    sheet = None
+    slot = 0
+    for frame in frames:
+        if sheet is None:
+            sheet = np.zeros((grid_rows * frame_height, grid_cols * frame_width, channels), dtype=np.uint8)
+        row, col = divmod(slot, grid_cols)
+        sheet[row * frame_height:(row + 1) * frame_height, col * frame_width:(col + 1) * frame_width] = frame
+        slot += 1
+        if slot == per_sheet:
+            yield sheet, slot
+            sheet = None
+            slot = 0
+
+    if sheet is not None:
+        yield sheet, slot
+
+
+def build_raw_sheets(input_file, output_file, fps, size, grid, paginate=False, max_pages=0, window=None, profiler=None,
+                     palette=0, dither='floyd-steinberg'):
+    """Build sprite sheet(s) through the raw pipe backend and encode each one once with Pillow.
+
+    Without paginate only the first sheet is written to output_file; with it,
+    sheets go to name_0.png, name_1.png, ... (up to max_pages, 0 = all).
+    With palette (a color count), sheets are written as indexed PNGs. A
+    single sheet gets a palette built from its own pixels; pages are encoded
+    as they fill, so they all share one palette from the same bounded first
+    pass the tile backend uses (see first_pass_palette). PNG encoding is
+    timed as the 'png write' stage of profiler, if given. Returns the list
+    of paths written.
+    """
+    from PIL import Image
+
+    profiler = profiler or Profiler()
+
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    pages = (max_pages or None) if paginate else 1
+    max_frames = grid_cols * grid_rows * pages if pages else None
+
+    colors = None
+    if palette and paginate:
+        with profiler.stage('palette'), first_pass_palette(input_file, size, palette, window) as palette_file:
+            colors = load_palette(palette_file, palette)
+
+    written = []
+    frames = iter_raw_frames(input_file, fps, size, window=window, max_frames=max_frames)
+    for index, (sheet, count) in enumerate(assemble_sheets(frames, grid, size)):
+        path = page_path(output_file, index) if paginate else output_file
+        image = Image.fromarray(sheet)
+        if palette:
+            with profiler.stage('palette'):
+                colors = colors or shared_palette([image], palette)
+                image = to_indexed(image, colors, dither)
+        with profiler.stage('png write'):
+            image.save(path)
+        profiler.count('frames decoded', count)
+        written.append(path)
+    return written
@@ -0,0 +1,107 @@
+# ABOUTME: Seek-based sparse frame sampling for long videos
+# ABOUTME: Grabs evenly spaced frames with fast input seeking and tiles them into a sprite sheet
+
+import io
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from spriter.palette import shared_palette, to_indexed
+from spriter.profiling import Profiler
+
+
+def sample_timestamps(duration, count):
+    """Return count timestamps centred in equal slices of the video's duration."""
+    return [duration * (i + 0.5) / count for i in range(count)]
+
+
+def build_seek_command(input_file, timestamp, size, exact=False):
+    """Build an ffmpeg command that decodes a single frame at timestamp as PNG on stdout.
+
+    -ss before -i seeks in the demuxer, so only the frames from the nearest
+    keyframe onward are decoded. By default the keyframe itself is returned
+    (-noaccurate_seek); exact=True decodes forward to the requested time.
+    """
+    cmd = ['ffmpeg', '-v', 'error']
+    if not exact:
+        cmd.append('-noaccurate_seek')
+    cmd += [
+        '-ss', f'{timestamp:.3f}',
+        '-i', str(input_file),
+        '-frames:v', '1',
+        '-vf', f'scale={size}',
+        '-f', 'image2pipe',
+        '-c:v', 'png',
+        '-'
+    ]
+    return cmd
+
+
+def grab_frame(input_file, timestamp, size, exact=False):
+    """Decode one frame at timestamp. Returns a PIL image, or None if nothing was decoded there."""
+    cmd = build_seek_command(input_file, timestamp, size, exact)
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd, stderr=result.stderr.decode(errors='replace'))
+    if not result.stdout:
+        return None
+    frame = Image.open(io.BytesIO(result.stdout))
+    frame.load()
+    return frame
+
+
+def tile_frames(frames, grid, size):
+    """Paste frames (None = missing) into a new sheet in grid order. Returns (sheet, placed indices)."""
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    frame_width, frame_height = map(int, size.split('x'))
+    sheet = Image.new('RGB', (grid_cols * frame_width, grid_rows * frame_height))
+    placed = []
+    for index, frame in enumerate(frames):
+        if frame is None:
+            continue
+        row, col = divmod(index, grid_cols)
+        sheet.paste(frame.convert('RGB'), (col * frame_width, row * frame_height))
+        placed.append(index)
+    return sheet, placed
+
+
+def assemble_seek_sheet(input_file, duration, size, grid, exact=False, jobs=None):
+    """Seek to cols*rows evenly spaced timestamps and tile the frames in memory.
+
+    Each frame is fetched by an independent seek, so the cost grows with the
+    number of tiles rather than the length of the video, and the seeks run in
+    parallel on up to jobs threads (default: one per CPU). Tiles that could not
+    be decoded are left blank. Returns (sheet_image, timestamps, placed) where
+    placed lists the tile indices that received a frame.
+    """
+    grid_cols, grid_rows = map(int, grid.split('x'))
+    timestamps = sample_timestamps(duration, grid_cols * grid_rows)
+
+    workers = min(len(timestamps), jobs or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(lambda ts: grab_frame(input_file, ts, size, exact), timestamps))
+
+    sheet, placed = tile_frames(frames, grid, size)
+    return sheet, timestamps, placed
+
+
+def build_seek_sheet(input_file, output_file, duration, size, grid, exact=False, jobs=None, profiler=None, palette=0,
+                     dither='floyd-steinberg'):
+    """Build a sprite sheet file from frames spread evenly over the whole video.
+
+    See assemble_seek_sheet. With palette (a color count) the sheet is
+    written as an indexed PNG. PNG encoding is timed as the 'png write'
+    stage of profiler, if given. Returns the number of frames placed.
+    """
+    profiler = profiler or Profiler()
+    
+    sheet, _, placed = assemble_seek_sheet(input_file, duration, size, grid, exact, jobs)
+    if palette:
+        with profiler.stage('palette'):
+            sheet = to_indexed(sheet, shared_palette([sheet], palette), dither)
+    with profiler.stage('png write'):
+        sheet.save(output_file)
+    profiler.count('frames decoded', len(placed))
+    return len(placed)
@@ -7,8 +7,19 @@ from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
 import tempfile
 import os
+import json
+import pytest
 
 from spriter.main import main
+from spriter.cache import cache_path
+from spriter.sampling import build_seek_sheet, sample_timestamps
+from spriter.probe import VideoInfo, estimate_frame_count, parse_probe_output, probe_video
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep the probe cache out of the user's home directory during tests"""
+    monkeypatch.setenv('SPRITER_CACHE_DIR', str(tmp_path / 'cache'))
 
 
 class TestSpriter:
@@ -101,6 +112,10 @@ class TestSpriter:
                 assert tmp_path in args
                 assert 'fps=2,scale=32x32,tile=2x2' in ' '.join(args)
                 
+                # Input decoding is capped to the window the 2x2 grid needs at 2fps
+                assert args.index('-t') < args.index('-i')
+                assert args[args.index('-t') + 1] == '2.500'
+                
         finally:
             os.unlink(tmp_path)
     
@@ -217,6 +232,436 @@ class TestSpriter:
         finally:
             os.unlink(tmp_path)
 
+    @patch('spriter.main.process_video_file')
+    @patch('subprocess.run')
+    def test_parallel_directory_processing(self, mock_run, mock_process):
+        """Test that --jobs runs files through the worker pool and keeps per-file results"""
+        mock_run.return_value = MagicMock(returncode=0)  # ffmpeg version check
+        mock_process.side_effect = lambda video_file, *args, **kwargs: video_file.stem != 'broken'
+        
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            for name in ['video1.mp4', 'video2.mov', 'broken.mp4']:
+                (tmpdir_path / name).write_bytes(b'fake video content')
+            
+            result = runner.invoke(main, [str(tmpdir_path), '--jobs', '3'])
+            
+            assert result.exit_code == 0
+            assert mock_process.call_count == 3
+            assert "Processing with 3 workers" in result.output
+            assert "3 files: 2 succeeded, 1 failed" in result.output
+            assert "broken.mp4" in result.output
+            
+            # Every worker would write the same --output file
+            result = runner.invoke(main, [str(tmpdir_path), '--jobs', '3', '--output', str(tmpdir_path / 'sheet.png')])
+            assert result.exit_code != 0
+            assert "--output" in result.output
+            assert mock_process.call_count == 3
+
+    @patch('subprocess.run')
+    def test_loop_and_gif_probe_once(self, mock_run):
+        """Test that --loop with --create-gif runs ffprobe a single time"""
+        from PIL import Image
+        
+        probe_json = json.dumps({
+            'streams': [{'width': 320, 'height': 240, 'nb_read_frames': '50', 'avg_frame_rate': '25/1',
+                         'codec_name': 'h264', 'pix_fmt': 'yuv420p'}],
+            'format': {'duration': '2.0'}
+        })
+        mock_run.side_effect = [
+            MagicMock(returncode=0),  # ffmpeg version check
+            MagicMock(returncode=0, stdout=probe_json),  # ffprobe
+            MagicMock(returncode=0)   # ffmpeg conversion
+        ]
+        
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+            output_path = Path(tmpdir) / "output.png"
+            Image.new('RGB', (64, 64), (200, 100, 50)).save(output_path)
+            
+            result = runner.invoke(main, [
+                str(video_path), '--output', str(output_path),
+                '--size', '32x32', '--grid', '2x2', '--loop', '--create-gif', '--gif-size', 'source'
+            ])
+            
+            assert result.exit_code == 0
+            probe_calls = [c for c in mock_run.call_args_list if c[0][0][0] == 'ffprobe']
+            assert len(probe_calls) == 1
+            assert "Video has 50 frames" in result.output
+            assert "Original video resolution: 320x240" in result.output
+            assert output_path.with_suffix('.gif').exists()
+            assert Image.open(output_path.with_suffix('.gif')).size == (320, 240)
+
+    @patch('subprocess.run')
+    def test_paginated_output(self, mock_run):
+        """Test that --paginate writes numbered pages from one ffmpeg call plus an index"""
+        from PIL import Image
+
+        def fake_run(cmd, **kwargs):
+            if cmd[0] == 'ffprobe':
+                return MagicMock(returncode=0, stdout=json.dumps({'streams': [{'width': 32, 'height': 32}], 'format': {}}))
+            if '-version' not in cmd:
+                pattern = cmd[-1]
+                for page in range(3):
+                    noise = Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3))
+                    noise.save(pattern.replace('%d', str(page)))
+            return MagicMock(returncode=0)
+        mock_run.side_effect = fake_run
+
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+            output_path = Path(tmpdir) / "sheet.png"
+
+            result = runner.invoke(main, [
+                str(video_path), '--output', str(output_path), '--fps', '4',
+                '--size', '32x32', '--grid', '2x2', '--paginate', '--create-gif'
+            ])
+
+            assert result.exit_code == 0
+            assert "3 sprite sheet pages created" in result.output
+            ffmpeg_calls = [c[0][0] for c in mock_run.call_args_list if c[0][0][0] == 'ffmpeg' and '-version' not in c[0][0]]
+            assert len(ffmpeg_calls) == 1
+            args = ffmpeg_calls[0]
+            assert '-frames:v' not in args and '-t' not in args
+            assert args[args.index('-start_number') + 1] == '0'
+            assert args[-1].endswith('sheet_%d.png')
+
+            index = json.loads((Path(tmpdir) / "sheet_index.json").read_text())
+            assert [page['file'] for page in index['pages']] == ['sheet_0.png', 'sheet_1.png', 'sheet_2.png']
+            assert index['pages'][2]['first_frame'] == 8
+            assert index['pages'][2]['start_time'] == 2.0
+
+            # 12 frames from three pages plus the loop frame
+            assert Image.open(Path(tmpdir) / "sheet.gif").n_frames == 13
+
+            # Without --max-pages an in-graph GIF would buffer every frame, so the pages are used instead
+            result = runner.invoke(main, [
+                str(video_path), '--output', str(output_path), '--fps', '4',
+                '--size', '32x32', '--grid', '2x2', '--paginate', '--create-gif', '--gif-mode', 'ffmpeg'
+            ])
+            assert result.exit_code == 0
+            assert "needs --max-pages" in result.output
+            args = mock_run.call_args_list[-1][0][0]
+            assert '-filter_complex' not in args and '-vf' in args
+            assert Image.open(Path(tmpdir) / "sheet.gif").n_frames == 13
+
+    @patch('subprocess.run')
+    def test_ffmpeg_gif_mode_single_pass(self, mock_run):
+        """Test that --gif-mode ffmpeg writes sheet and GIF from one ffmpeg call"""
+        def fake_run(cmd, **kwargs):
+            if cmd[0] == 'ffprobe':
+                return MagicMock(returncode=0, stdout=json.dumps({'streams': [{'width': 3840, 'height': 2160}], 'format': {}}))
+            if '-version' not in cmd:
+                Path(cmd[-1]).write_bytes(b'fake gif content')
+            return MagicMock(returncode=0)
+        mock_run.side_effect = fake_run
+
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+            output_path = Path(tmpdir) / "sheet.png"
+            output_path.write_bytes(b'fake png content')
+
+            result = runner.invoke(main, [
+                str(video_path), '--output', str(output_path), '--fps', '5',
+                '--size', '32x32', '--grid', '3x2', '--create-gif', '--gif-mode', 'ffmpeg'
+            ])
+
+            assert result.exit_code == 0
+            assert "same decode pass" in result.output
+            # Version check plus one conversion; no ffprobe and no Pillow re-read
+            assert mock_run.call_count == 2
+            args = mock_run.call_args_list[1][0][0]
+            assert '-vf' not in args
+            graph = args[args.index('-filter_complex') + 1]
+            assert 'tile=3x2[sheet]' in graph
+            assert 'trim=end_frame=6' in graph
+            # The first frame is repeated at the end, like the Pillow preview's loop frame
+            assert '[first]trim=end_frame=1[loop_frame];[body][loop_frame]concat=n=2:v=1:a=0' in graph
+            assert 'palettegen' in graph and 'paletteuse' in graph
+            # -frames:v 1 applies to the sheet output only
+            assert args.index('[sheet]') < args.index('-frames:v') < args.index(str(output_path)) < args.index('[gif]')
+            assert args[-1] == str(output_path.with_suffix('.gif'))
+
+            # Seven 4K RGB32 frames (~230 MB) wait for palettegen, so a 50 MB budget shrinks them in the graph
+            result = runner.invoke(main, [
+                str(video_path), '--output', str(output_path), '--fps', '5', '--size', '32x32', '--grid', '3x2',
+                '--create-gif', '--gif-mode', 'ffmpeg', '--gif-size', 'source', '--gif-max-memory', '50'
+            ])
+            assert result.exit_code == 0
+            assert "Preview frames reduced to" in result.output
+            graph = mock_run.call_args_list[-1][0][0][mock_run.call_args_list[-1][0][0].index('-filter_complex') + 1]
+            width, height = map(int, graph.split('[anim]scale=')[1].split(',')[0].split('x'))
+            assert 7 * width * height * 4 <= 50 * 1024 * 1024
+
+    @patch('subprocess.run')
+    def test_gif_defaults_to_sheet_size(self, mock_run):
+        """Test that the preview GIF keeps the tile size and needs no ffprobe"""
+        from PIL import Image
+
+        mock_run.return_value = MagicMock(returncode=0)
+
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+            output_path = Path(tmpdir) / "sheet.png"
+            Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3)).save(output_path)
+
+            result = runner.invoke(main, [str(video_path), '--output', str(output_path), '--grid', '2x2', '--create-gif'])
+
+            assert result.exit_code == 0
+            assert all(c[0][0][0] != 'ffprobe' for c in mock_run.call_args_list)
+            assert Image.open(output_path.with_suffix('.gif')).size == (32, 32)
+
+            result = runner.invoke(main, [str(video_path), '--output', str(output_path), '--grid', '2x2', '--create-gif',
+                                          '--gif-size', '100x50', '--gif-max-memory', '0'])
+            assert Image.open(output_path.with_suffix('.gif')).size == (100, 50)
+
+            result = runner.invoke(main, [str(video_path), '--gif-size', 'huge'])
+            assert result.exit_code != 0
+
+    def test_preview_frame_size_memory_guard(self):
+        """Test that the memory guard shrinks preview frames but keeps the aspect ratio"""
+        from spriter.main import preview_frame_size
+
+        assert preview_frame_size('sheet', (64, 32), (3840, 2160), 37, 256) == ((64, 32), False)
+        assert preview_frame_size('source', (64, 32), None, 37, 256) == ((64, 32), False)
+        # 37 4K RGB frames need ~920 MB
+        (width, height), limited = preview_frame_size('source', (64, 32), (3840, 2160), 37, 256)
+        assert limited
+        assert 37 * width * height * 3 <= 256 * 1024 * 1024
+        assert abs(width / height - 3840 / 2160) < 0.01
+
+    @patch('subprocess.run')
+    def test_paginate_max_pages(self, mock_run):
+        """Test that --max-pages caps both the decode window and the page count"""
+        mock_run.return_value = MagicMock(returncode=0)
+
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+
+            runner.invoke(main, [str(video_path), '--fps', '2', '--grid', '2x2', '--paginate', '--max-pages', '3'])
+
+            args = mock_run.call_args_list[1][0][0]
+            assert args[args.index('-t') + 1] == '6.500'
+            assert args[args.index('-frames:v') + 1] == '3'
+
+    @patch('subprocess.run')
+    def test_multiple_presets_single_decode(self, mock_run):
+        """Test that several presets are built by one ffmpeg run with a branch per preset"""
+        from PIL import Image
+
+        def fake_ffmpeg(cmd, **kwargs):
+            if cmd[0] == 'ffprobe':
+                return MagicMock(returncode=0, stdout=json.dumps({'streams': [{'width': 96, 'height': 96}], 'format': {'duration': '5'}}))
+            if '-filter_complex' in cmd:
+                for i, arg in enumerate(cmd):
+                    if arg == '-y':
+                        Image.new('RGB', (64, 64), (200, 100, 50)).save(cmd[i + 1])
+            return MagicMock(returncode=0)
+        mock_run.side_effect = fake_ffmpeg
+
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+
+            result = runner.invoke(main, [str(video_path), '--preset', 'game', '--preset', 'web'])
+
+            assert result.exit_code == 0
+            conversions = [c[0][0] for c in mock_run.call_args_list if '-i' in c[0][0]]
+            assert len(conversions) == 1
+            args = conversions[0]
+            graph = args[args.index('-filter_complex') + 1]
+            assert graph.startswith('[0:v]split=2[in0][in1]')
+            assert '[in0]fps=10,scale=64x64,tile=6x6[sheet0]' in graph
+            assert '[in1]fps=8,scale=32x32,tile=4x4[sheet1]' in graph
+            # The longest window wins: game needs (36 + 1) / 10 seconds
+            assert args[args.index('-t') + 1] == '3.700'
+            assert (Path(tmpdir) / "clip_spritesheet_game.png").exists()
+            assert (Path(tmpdir) / "clip_spritesheet_web.png").exists()
+            assert "web sprite sheet created" in result.output
+
+            # Source-sized previews for every preset share one probe
+            mock_run.reset_mock()
+            result = runner.invoke(main, [str(video_path), '--all-presets', '--create-gif', '--gif-size', 'source', '--no-cache'])
+            assert result.exit_code == 0
+            assert len([c for c in mock_run.call_args_list if c[0][0][0] == 'ffprobe']) == 1
+
+    @patch('subprocess.run')
+    def test_incremental_skips_up_to_date_files(self, mock_run):
+        """Test that --incremental only rebuilds files whose input or options changed"""
+        def fake_ffmpeg(cmd, **kwargs):
+            if '-i' in cmd:
+                Path(cmd[-1]).write_bytes(b'fake png content')
+            return MagicMock(returncode=0)
+        mock_run.side_effect = fake_ffmpeg
+
+        def conversions():
+            return [c[0][0][c[0][0].index('-i') + 1] for c in mock_run.call_args_list if '-i' in c[0][0]]
+
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            first = tmpdir_path / "first.mp4"
+            second = tmpdir_path / "second.mp4"
+            first.write_bytes(b'fake video content')
+            second.write_bytes(b'other video content')
+
+            result = runner.invoke(main, [tmpdir, '--incremental'])
+            assert result.exit_code == 0
+            assert sorted(conversions()) == [str(first), str(second)]
+            assert (tmpdir_path / '.spriter-manifest.json').exists()
+
+            mock_run.reset_mock()
+            result = runner.invoke(main, [tmpdir, '--incremental'])
+            assert conversions() == []
+            assert result.output.count("Up to date") == 2
+
+            # A changed input or changed options invalidate the fingerprint
+            mock_run.reset_mock()
+            second.write_bytes(b'edited video content!')
+            runner.invoke(main, [tmpdir, '--incremental'])
+            assert conversions() == [str(second)]
+
+            mock_run.reset_mock()
+            runner.invoke(main, [tmpdir, '--incremental', '--fps', '12'])
+            assert len(conversions()) == 2
+
+            # A deleted output is rebuilt even though the manifest remembers it
+            mock_run.reset_mock()
+            (tmpdir_path / "first_spritesheet_10fps_64x64_6x6.png").unlink()
+            runner.invoke(main, [tmpdir, '--incremental'])
+            assert conversions() == [str(first)]
+
+            # Options reach the build on incremental runs, not just the fingerprint
+            mock_run.reset_mock()
+            runner.invoke(main, [tmpdir, '--incremental', '--palette', '16'])
+            assert len(conversions()) == 2
+            assert all('palettegen=max_colors=16' in ' '.join(c[0][0]) for c in mock_run.call_args_list if '-i' in c[0][0])
+
+    def test_all_presets_rejects_paginate(self):
+        """Test that multiple presets refuse modes that can't share one decode"""
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+
+            result = runner.invoke(main, [str(video_path), '--all-presets', '--paginate'])
+
+            assert result.exit_code != 0
+            assert "Multiple presets" in result.output
+
+
+class TestProbe:
+    
+    def test_parse_probe_output(self):
+        """Test that a single ffprobe JSON payload fills every VideoInfo field"""
+        info = parse_probe_output(json.dumps({
+            'streams': [{'width': 1920, 'height': 1080, 'nb_frames': '300', 'avg_frame_rate': '30000/1001',
+                         'codec_name': 'h264', 'pix_fmt': 'yuv420p'}],
+            'format': {'duration': '10.01'}
+        }))
+        assert info == VideoInfo(duration=10.01, frame_count=300, width=1920, height=1080,
+                                 frame_rate=30000 / 1001, codec='h264', pix_fmt='yuv420p')
+    
+    def test_parse_probe_output_missing_fields(self):
+        """Test that missing or unusable ffprobe values become None"""
+        info = parse_probe_output(json.dumps({
+            'streams': [{'nb_frames': 'N/A', 'avg_frame_rate': '0/0'}],
+            'format': {}
+        }))
+        assert info.duration is None
+        assert info.frame_count is None
+        assert info.frame_rate is None
+
+    
+    @patch('subprocess.run')
+    def test_frame_count_prefers_header(self, mock_run):
+        """Test that a header frame count is used without spawning ffprobe"""
+        count, method = estimate_frame_count('clip.mp4', VideoInfo(frame_count=120), use_cache=False)
+        assert (count, method) == (120, 'header')
+        mock_run.assert_not_called()
+    
+    @patch('subprocess.run')
+    def test_frame_count_tiers(self, mock_run):
+        """Test the packets, estimate and decode fallbacks in order"""
+        mock_run.return_value = MagicMock(returncode=0, stdout='250\n')
+        count, method = estimate_frame_count('clip.mkv', VideoInfo(), use_cache=False)
+        assert (count, method) == (250, 'packets')
+        assert '-count_packets' in mock_run.call_args[0][0]
+        assert '-count_frames' not in mock_run.call_args[0][0]
+        
+        mock_run.return_value = MagicMock(returncode=0, stdout='')
+        count, method = estimate_frame_count('clip.mkv', VideoInfo(duration=4.0, frame_rate=25.0), use_cache=False)
+        assert (count, method) == (100, 'estimate')
+        
+        assert estimate_frame_count('clip.mkv', VideoInfo(), use_cache=False) == (None, None)
+        
+        mock_run.side_effect = [
+            MagicMock(returncode=0, stdout=''),  # packet count
+            MagicMock(returncode=0, stdout=json.dumps({'streams': [{'nb_read_frames': '99'}], 'format': {}}))
+        ]
+        count, method = estimate_frame_count('clip.mkv', VideoInfo(), allow_decode=True, use_cache=False)
+        assert (count, method) == (99, 'decode')
+        assert '-count_frames' in mock_run.call_args[0][0]
+
+class TestProbeCache:
+    
+    PROBE_JSON = json.dumps({'streams': [{'width': 64, 'height': 48}], 'format': {'duration': '3.5'}})
+    
+    @patch('subprocess.run')
+    def test_cache_hit_skips_ffprobe(self, mock_run, tmp_path):
+        """Test that a second probe of an unchanged file is served from the cache"""
+        mock_run.return_value = MagicMock(returncode=0, stdout=self.PROBE_JSON)
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b'fake video content')
+        
+        first = probe_video(video)
+        second = probe_video(video)
+        
+        assert first == second
+        assert second.duration == 3.5
+        assert mock_run.call_count == 1
+    
+    @patch('subprocess.run')
+    def test_cache_invalidated_by_change_and_bypass(self, mock_run, tmp_path):
+        """Test that modified files and use_cache=False both re-run ffprobe"""
+        mock_run.return_value = MagicMock(returncode=0, stdout=self.PROBE_JSON)
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b'fake video content')
+        
+        probe_video(video)
+        video.write_bytes(b'different and longer fake video content')
+        probe_video(video)
+        probe_video(video, use_cache=False)
+        
+        assert mock_run.call_count == 3
+    
+    @patch('subprocess.run')
+    def test_clear_cache_option(self, mock_run, tmp_path):
+        """Test that --clear-cache deletes the cache without needing an input path"""
+        mock_run.return_value = MagicMock(returncode=0, stdout=self.PROBE_JSON)
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b'fake video content')
+        probe_video(video)
+        assert cache_path().exists()
+        
+        result = CliRunner().invoke(main, ['--clear-cache'])
+        
+        assert result.exit_code == 0
+        assert "Cleared probe cache" in result.output
+        assert not cache_path().exists()
+
 
 def test_integration_with_real_file():
     """Integration test with actual video file if available"""
@@ -240,4 +685,1005 @@ def test_integration_with_real_file():
             assert str(expected_output) in result.output
         else:
             # If it fails, it should be due to missing ffmpeg
-            assert "ffmpeg" in result.output
\ No newline at end of file
+            assert "ffmpeg" in result.output
+
+class TestSeekSampling:
+    
+    @staticmethod
+    def png_bytes(color, size=(16, 16)):
+        from PIL import Image
+        import io
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, format='PNG')
+        return buffer.getvalue()
+    
+    def test_sample_timestamps(self):
+        """Test that timestamps are spread evenly over the whole duration"""
+        assert sample_timestamps(8.0, 4) == [1.0, 3.0, 5.0, 7.0]
+    
+    @patch('subprocess.run')
+    def test_build_seek_sheet(self, mock_run, tmp_path):
+        """Test that one seek per tile is issued and frames are tiled in order"""
+        from PIL import Image
+        
+        def fake_seek(cmd, **kwargs):
+            timestamp = float(cmd[cmd.index('-ss') + 1])
+            return MagicMock(returncode=0, stdout=self.png_bytes((int(timestamp * 10), 0, 0)))
+        mock_run.side_effect = fake_seek
+        output = tmp_path / "sheet.png"
+        
+        placed = build_seek_sheet('long.mp4', output, 100.0, '16x16', '2x2')
+        
+        assert placed == 4
+        assert mock_run.call_count == 4
+        for call in mock_run.call_args_list:
+            cmd = call[0][0]
+            assert cmd.index('-ss') < cmd.index('-i')
+            assert '-noaccurate_seek' in cmd
+        sheet = Image.open(output)
+        assert sheet.size == (32, 32)
+        assert sheet.getpixel((0, 0))[0] < sheet.getpixel((16, 16))[0]
+    
+    @patch('subprocess.run')
+    def test_exact_seek_and_missing_frames(self, mock_run, tmp_path):
+        """Test exact seeking and that undecodable tiles are left blank"""
+        mock_run.side_effect = [
+            MagicMock(returncode=0, stdout=self.png_bytes((255, 255, 255))),
+            MagicMock(returncode=0, stdout=b'')
+        ]
+        
+        placed = build_seek_sheet('clip.mp4', tmp_path / "sheet.png", 2.0, '16x16', '2x1', exact=True, jobs=1)
+        
+        assert placed == 1
+        assert all('-noaccurate_seek' not in call[0][0] for call in mock_run.call_args_list)
+
+
+class TestRawPipeBackend:
+    
+    @staticmethod
+    def fake_ffmpeg(frame_values, width=4, height=2, channels=3):
+        """A Popen stand-in whose stdout streams solid raw frames"""
+        import io
+        data = b''.join(bytes([value]) * (width * height * channels) for value in frame_values)
+        process = MagicMock()
+        process.stdout = io.BytesIO(data)
+        process.poll.return_value = None
+        process.communicate.return_value = (b'', b'')
+        process.returncode = 0
+        return process
+    
+    @patch('subprocess.Popen')
+    def test_frames_fill_tile_slots(self, mock_popen, tmp_path):
+        """Test that raw frames land in row-major tile slots of a single encoded sheet"""
+        np = pytest.importorskip('numpy')
+        from PIL import Image
+        from spriter.rawpipe import build_raw_sheets
+        
+        mock_popen.return_value = self.fake_ffmpeg([10, 20, 30, 40, 50, 60])
+        output = tmp_path / "sheet.png"
+        
+        written = build_raw_sheets('clip.mp4', output, 10, '4x2', '2x2')
+        
+        assert written == [output]
+        sheet = np.asarray(Image.open(output))
+        assert sheet.shape == (4, 8, 3)
+        assert sheet[0, 0, 0] == 10 and sheet[0, 4, 0] == 20
+        assert sheet[2, 0, 0] == 30 and sheet[2, 4, 0] == 40
+        # ffmpeg is stopped once the grid is full
+        mock_popen.return_value.kill.assert_called_once()
+        cmd = mock_popen.call_args[0][0]
+        assert cmd[cmd.index('-f') + 1] == 'rawvideo'
+    
+    @patch('subprocess.Popen')
+    def test_paginated_raw_sheets(self, mock_popen, tmp_path):
+        """Test that pagination fills pages in order and leaves the last page's spare slots blank"""
+        np = pytest.importorskip('numpy')
+        from PIL import Image
+        from spriter.rawpipe import build_raw_sheets
+        
+        mock_popen.return_value = self.fake_ffmpeg([10, 20, 30, 40, 50])
+        
+        written = build_raw_sheets('clip.mp4', tmp_path / "sheet.png", 10, '4x2', '2x2', paginate=True)
+        
+        assert [path.name for path in written] == ['sheet_0.png', 'sheet_1.png']
+        last = np.asarray(Image.open(written[1]))
+        assert last[0, 0, 0] == 50
+        assert last[0, 4, 0] == 0
+    
+    @patch('subprocess.Popen')
+    def test_raw_backend_error(self, mock_popen, tmp_path):
+        """Test that an ffmpeg failure before any frame raises CalledProcessError"""
+        pytest.importorskip('numpy')
+        from spriter.rawpipe import build_raw_sheets
+        
+        process = self.fake_ffmpeg([])
+        process.poll.return_value = 1
+        process.returncode = 1
+        process.communicate.return_value = (b'', b'Invalid data found')
+        mock_popen.return_value = process
+        
+        with pytest.raises(subprocess.CalledProcessError) as excinfo:
+            build_raw_sheets('broken.mp4', tmp_path / "sheet.png", 10, '4x2', '2x2')
+        assert 'Invalid data' in excinfo.value.stderr
+
+
+class TestBlankDetection:
+    
+    @staticmethod
+    def make_sheet():
+        """2x2 sheet: black, dark checkerboard, bright, near-black noise"""
+        from PIL import Image
+        sheet = Image.new('RGB', (32, 32), (0, 0, 0))
+        checker = Image.new('RGB', (16, 16))
+        checker.putdata([(18, 18, 18) if (x + y) % 2 else (0, 0, 0) for y in range(16) for x in range(16)])
+        sheet.paste(checker, (16, 0))
+        sheet.paste(Image.new('RGB', (16, 16), (200, 180, 160)), (0, 16))
+        noise = Image.new('RGB', (16, 16))
+        noise.putdata([((x * 7 + y) % 4,) * 3 for y in range(16) for x in range(16)])
+        sheet.paste(noise, (16, 16))
+        return sheet
+    
+    def test_vectorized_blank_tiles(self):
+        """Test that flat dark tiles are blank but dark detailed tiles are kept"""
+        pytest.importorskip('numpy')
+        from spriter.blank import find_blank_tiles
+        
+        blank, (means, maxes, variances) = find_blank_tiles(self.make_sheet(), 2, 2)
+        
+        assert blank == [[True, False], [False, True]]
+        assert maxes[0][1] == 18
+        assert variances[0][1] > 25
+    
+    def test_thresholds_are_configurable(self):
+        """Test that raising the max threshold treats the dark checkerboard as blank"""
+        from spriter.blank import BlankThresholds, find_blank_tiles
+        
+        blank, _ = find_blank_tiles(self.make_sheet(), 2, 2, BlankThresholds(max=20))
+        assert blank == [[True, True], [False, True]]
+    
+    def test_pillow_fallback_matches_numpy(self):
+        """Test that the Pillow-only path agrees with the vectorized one"""
+        pytest.importorskip('numpy')
+        import spriter.blank as blank_module
+        
+        vectorized, _ = blank_module.find_blank_tiles(self.make_sheet(), 2, 2)
+        with patch.object(blank_module, 'NUMPY_AVAILABLE', False):
+            fallback, _ = blank_module.find_blank_tiles(self.make_sheet(), 2, 2)
+        assert fallback == vectorized
+
+
+class TestStreamingGifWriter:
+    
+    def test_frames_are_written_incrementally(self, tmp_path):
+        """Test that frames hit the file as they are added and the result is a looping GIF"""
+        from PIL import Image
+        from spriter.gifwriter import StreamingGifWriter
+        
+        gif_path = tmp_path / "preview.gif"
+        with StreamingGifWriter(gif_path, 150) as writer:
+            sizes = []
+            for _ in range(4):
+                writer.add_frame(Image.frombytes('RGB', (24, 16), os.urandom(24 * 16 * 3)))
+                writer._fp.flush()
+                sizes.append(writer._temp_path.stat().st_size)
+            assert sizes == sorted(sizes) and len(set(sizes)) == 4
+            assert not gif_path.exists()
+        
+        gif = Image.open(gif_path)
+        assert gif.n_frames == 4
+        assert gif.size == (24, 16)
+        assert gif.info['loop'] == 0
+        assert gif.info['duration'] == 150
+    
+    def test_empty_or_failed_gif_leaves_no_file(self, tmp_path):
+        """Test that no file is left behind without frames or after an error"""
+        from PIL import Image
+        from spriter.gifwriter import StreamingGifWriter
+        
+        gif_path = tmp_path / "preview.gif"
+        writer = StreamingGifWriter(gif_path, 100)
+        assert writer.close() is False
+        
+        with pytest.raises(RuntimeError):
+            with StreamingGifWriter(gif_path, 100) as writer:
+                writer.add_frame(Image.new('RGB', (8, 8), (255, 0, 0)))
+                raise RuntimeError("boom")
+        
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestLibraryAPI:
+    
+    @patch('subprocess.run')
+    def test_build_sheet_in_memory(self, mock_run, tmp_path, capsys):
+        """Test that build_sheet returns PNG bytes, frame rects and timings without printing"""
+        import io
+        from PIL import Image
+        import spriter
+        
+        png = io.BytesIO()
+        Image.new('RGB', (96, 64), (90, 90, 90)).save(png, format='PNG')
+        mock_run.side_effect = [
+            MagicMock(returncode=0, stdout=json.dumps({'streams': [{'width': 640, 'height': 360}], 'format': {'duration': '0.5'}})),
+            MagicMock(returncode=0, stdout=png.getvalue())
+        ]
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b'fake video content')
+        
+        result = spriter.build_sheet(source, fps=8, size='32x32', grid='3x2')
+        
+        assert capsys.readouterr().out == ''
+        assert not any(path.suffix == '.png' for path in tmp_path.iterdir())
+        assert result.image == png.getvalue()
+        assert (result.width, result.height, result.grid) == (96, 64, (3, 2))
+        # 0.5s at 8fps only fills four of the six tiles
+        assert [frame.index for frame in result.frames] == [0, 1, 2, 3]
+        assert result.frames[3] == spriter.SheetFrame(3, 0, 32, 32, 32, 0.375)
+        assert result.video_info.width == 640
+        assert set(result.timings) == {'probe', 'decode', 'encode', 'total'}
+        cmd = mock_run.call_args[0][0]
+        assert cmd[-1] == '-' and 'image2pipe' in cmd
+    
+    @patch('subprocess.Popen')
+    @patch('subprocess.run')
+    def test_build_sheet_raw_backend_array(self, mock_run, mock_popen, tmp_path):
+        """Test that the raw backend hands back the assembled NumPy array"""
+        pytest.importorskip('numpy')
+        import spriter
+        
+        mock_run.side_effect = FileNotFoundError()  # no ffprobe: fps sampling still works
+        mock_popen.return_value = TestRawPipeBackend.fake_ffmpeg([10, 20, 30], width=4, height=2)
+        
+        result = spriter.build_sheet('clip.mp4', fps=10, size='4x2', grid='2x2', backend='raw', use_cache=False)
+        
+        assert result.array.shape == (4, 8, 3)
+        assert result.array[2, 0, 0] == 30
+        assert len(result.frames) == 3
+        assert result.image.startswith(b'\x89PNG')
+    
+    def test_build_sheet_rejects_bad_arguments(self):
+        """Test that invalid sizes and modes raise ValueError"""
+        import spriter
+        
+        with pytest.raises(ValueError):
+            spriter.build_sheet('clip.mp4', grid='six')
+        with pytest.raises(ValueError):
+            spriter.build_sheet('clip.mp4', sampling='random')
+
+
+class TestAsyncAPI:
+    
+    @staticmethod
+    def sleeper_command(seconds=30):
+        """A child process that outlives any test timeout"""
+        import sys
+        return [sys.executable, '-c', f'import time; time.sleep({seconds})']
+    
+    def test_run_process_timeout_kills_child(self):
+        """Test that a timed-out call kills and reaps its child process"""
+        import asyncio
+        from spriter.aio import run_process
+        
+        spawned = []
+        real_exec = asyncio.create_subprocess_exec
+        
+        async def recording_exec(*args, **kwargs):
+            process = await real_exec(*args, **kwargs)
+            spawned.append(process)
+            return process
+        
+        with patch('asyncio.create_subprocess_exec', recording_exec):
+            with pytest.raises(asyncio.TimeoutError):
+                asyncio.run(run_process(self.sleeper_command(), timeout=0.2))
+        
+        assert len(spawned) == 1
+        assert spawned[0].returncode is not None and spawned[0].returncode != 0
+    
+    def test_run_process_raises_on_failure(self):
+        """Test that a non-zero exit raises CalledProcessError with stderr"""
+        import asyncio
+        import sys
+        from spriter.aio import run_process
+        
+        cmd = [sys.executable, '-c', 'import sys; sys.stderr.write("boom"); sys.exit(3)']
+        with pytest.raises(subprocess.CalledProcessError) as excinfo:
+            asyncio.run(run_process(cmd))
+        assert excinfo.value.returncode == 3
+        assert excinfo.value.stderr == 'boom'
+    
+    def test_build_sheet_async_in_memory(self, tmp_path):
+        """Test that build_sheet_async returns the same SheetResult shape as build_sheet"""
+        import asyncio
+        import io
+        from PIL import Image
+        import spriter
+        
+        png = io.BytesIO()
+        Image.new('RGB', (96, 64), (90, 90, 90)).save(png, format='PNG')
+        outputs = [
+            json.dumps({'streams': [{'width': 640, 'height': 360}], 'format': {'duration': '0.5'}}).encode(),
+            png.getvalue()
+        ]
+        commands = []
+        
+        async def fake_run_process(cmd, timeout=None):
+            commands.append(cmd)
+            return outputs.pop(0)
+        
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b'fake video content')
+        with patch('spriter.aio.run_process', fake_run_process):
+            result = asyncio.run(spriter.build_sheet_async(source, fps=8, size='32x32', grid='3x2'))
+        
+        assert commands[0][0] == 'ffprobe' and commands[1][0] == 'ffmpeg'
+        assert result.image == png.getvalue()
+        assert [frame.index for frame in result.frames] == [0, 1, 2, 3]
+        assert result.video_info.width == 640
+        assert set(result.timings) == {'probe', 'decode', 'encode', 'total'}
+    
+    def test_build_sheet_async_blocking_work_leaves_the_loop(self, tmp_path):
+        """Test that cache access, PNG decoding and the encode step run on worker threads"""
+        import asyncio
+        import io
+        import threading
+        from PIL import Image
+        import spriter
+        from spriter import aio
+        
+        png = io.BytesIO()
+        Image.new('RGB', (96, 64), (90, 90, 90)).save(png, format='PNG')
+        outputs = [json.dumps({'format': {'duration': '0.5'}}).encode(), png.getvalue()]
+        threads = {}
+        
+        def recording(name, function):
+            def wrapper(*args, **kwargs):
+                threads[name] = threading.current_thread()
+                return function(*args, **kwargs)
+            return wrapper
+        
+        async def fake_run_process(cmd, timeout=None):
+            return outputs.pop(0)
+        
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b'fake video content')
+        with patch('spriter.aio.run_process', fake_run_process), \
+                patch('spriter.aio.cached_probe', recording('cache get', aio.cached_probe)), \
+                patch('spriter.aio.store_probe', recording('cache put', aio.store_probe)), \
+                patch('spriter.aio._decode_png', recording('decode', aio._decode_png)), \
+                patch('spriter.aio.sheet_result', recording('encode', aio.sheet_result)):
+            asyncio.run(spriter.build_sheet_async(source, fps=8, size='32x32', grid='3x2'))
+        
+        assert set(threads) == {'cache get', 'cache put', 'decode', 'encode'}
+        assert all(thread is not threading.main_thread() for thread in threads.values())
+    
+    def test_build_sheet_async_timeout_kills_ffmpeg(self):
+        """Test that a job timeout kills the running ffmpeg child"""
+        import asyncio
+        import spriter
+        
+        spawned = []
+        real_exec = asyncio.create_subprocess_exec
+        
+        async def recording_exec(program, *args, **kwargs):
+            if program == 'ffprobe':
+                raise FileNotFoundError(program)  # fps sampling works without a probe
+            process = await real_exec(program, *args, **kwargs)
+            spawned.append(process)
+            return process
+        
+        async def run_jobs():
+            return await asyncio.gather(
+                spriter.build_sheet_async('clip.mp4', use_cache=False, timeout=0.2),
+                spriter.build_sheet_async('clip.mp4', use_cache=False, timeout=0.2),
+                return_exceptions=True
+            )
+        
+        with patch('asyncio.create_subprocess_exec', recording_exec), \
+                patch('spriter.aio.tile_sheet_command', lambda *args: self.sleeper_command()):
+            results = asyncio.run(run_jobs())
+        
+        assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+        assert len(spawned) == 2
+        assert all(process.returncode is not None for process in spawned)
+    
+    def test_cancelling_build_sheet_async_kills_ffmpeg(self):
+        """Test that cancelling the calling task kills the running ffmpeg child"""
+        import asyncio
+        import spriter
+        
+        spawned = []
+        real_exec = asyncio.create_subprocess_exec
+        
+        async def recording_exec(program, *args, **kwargs):
+            if program == 'ffprobe':
+                raise FileNotFoundError(program)
+            process = await real_exec(program, *args, **kwargs)
+            spawned.append(process)
+            return process
+        
+        async def cancel_job():
+            task = asyncio.create_task(spriter.build_sheet_async('clip.mp4', use_cache=False))
+            while not spawned:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        
+        with patch('asyncio.create_subprocess_exec', recording_exec), \
+                patch('spriter.aio.tile_sheet_command', lambda *args: self.sleeper_command()):
+            asyncio.run(cancel_job())
+        
+        assert spawned[0].returncode is not None
+
+
+class TestProfiling:
+    
+    def test_nested_stages_report_self_time(self):
+        """Test that a nested stage's time is not counted twice"""
+        import time
+        from spriter.profiling import Profiler
+        
+        profiler = Profiler()
+        with profiler.stage('decode'):
+            with profiler.stage('png write'):
+                time.sleep(0.05)
+        profiler.count('bytes written', 100)
+        profiler.count('bytes written', 23)
+        
+        report = profiler.report()
+        assert report['stages']['png write']['seconds'] >= 0.05
+        assert report['stages']['decode']['seconds'] < 0.05
+        assert report['stages']['decode']['calls'] == 1
+        assert report['counters'] == {'bytes written': 123}
+    
+    @patch('subprocess.run')
+    def test_profile_flag_prints_table_and_json(self, mock_run):
+        """Test that --profile-json prints the breakdown and writes it as JSON"""
+        from PIL import Image
+        
+        mock_run.return_value = MagicMock(returncode=0)
+        
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+            output_path = Path(tmpdir) / "output.png"
+            Image.new('RGB', (64, 64), (200, 100, 50)).save(output_path)
+            profile_path = Path(tmpdir) / "profile.json"
+            
+            result = runner.invoke(main, [
+                str(video_path), '--output', str(output_path), '--grid', '2x2', '--size', '32x32',
+                '--create-gif', '--profile-json', str(profile_path)
+            ])
+            
+            assert result.exit_code == 0
+            assert "Profile" in result.output
+            report = json.loads(profile_path.read_text())
+            assert {'ffmpeg check', 'decode', 'gif encode', 'gif blank detection'} <= set(report['stages'])
+            assert report['counters']['sheets written'] == 1
+            # Profiling doesn't add a probe, so without a duration every slot counts as filled
+            assert all(c[0][0][0] != 'ffprobe' for c in mock_run.call_args_list)
+            assert report['counters']['tiles filled'] == 4
+            assert report['counters']['gif frames'] == 5  # four tiles plus the loop frame
+            assert report['counters']['bytes written'] > output_path.stat().st_size
+
+
+class TestFfmpegProgress:
+    
+    @staticmethod
+    def fake_ffmpeg(tmp_path, body):
+        """An executable that stands in for ffmpeg and runs the given Python body"""
+        import stat
+        import sys
+        script = tmp_path / "fake-ffmpeg"
+        script.write_text(f"#!{sys.executable}\nimport sys, time\n{body}\n")
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+        return [str(script), '-i', 'clip.mp4', 'out.png']
+    
+    def test_parse_progress_blocks(self):
+        """Test that key=value blocks become ProgressUpdates with N/A handled"""
+        from spriter.ffprogress import iter_progress_blocks
+        
+        lines = [
+            'frame=12\n', 'out_time_us=1500000\n', 'out_time=00:00:01.500000\n', 'speed=2.5x\n', 'progress=continue\n',
+            'frame=0\n', 'out_time_us=N/A\n', 'out_time=N/A\n', 'speed=N/A\n', 'progress=continue\n',
+            'frame=30\n', 'out_time=00:01:02.250000\n', 'speed= 3x\n', 'progress=end\n'
+        ]
+        updates = list(iter_progress_blocks(lines))
+        
+        assert [(u.out_time, u.frame, u.speed, u.done) for u in updates] == [
+            (1.5, 12, 2.5, False),
+            (None, 0, None, False),
+            (62.25, 30, 3.0, True)
+        ]
+    
+    def test_run_with_progress_reports_updates(self, tmp_path):
+        """Test that progress blocks are delivered while ffmpeg runs"""
+        from spriter.ffprogress import run_with_progress
+        
+        cmd = self.fake_ffmpeg(tmp_path, (
+            "assert sys.argv[1:4] == ['-progress', 'pipe:1', '-nostats']\n"
+            "print('out_time_us=500000\\nspeed=1.5x\\nprogress=continue', flush=True)\n"
+            "print('out_time_us=1000000\\nspeed=2x\\nprogress=end', flush=True)"
+        ))
+        updates = []
+        
+        run_with_progress(cmd, updates.append)
+        
+        assert [(u.out_time, u.speed) for u in updates] == [(0.5, 1.5), (1.0, 2.0)]
+    
+    def test_run_with_progress_failure(self, tmp_path):
+        """Test that a failing ffmpeg raises CalledProcessError with its stderr"""
+        from spriter.ffprogress import run_with_progress
+        
+        cmd = self.fake_ffmpeg(tmp_path, "sys.stderr.write('bad input'); sys.exit(1)")
+        with pytest.raises(subprocess.CalledProcessError) as excinfo:
+            run_with_progress(cmd)
+        assert excinfo.value.stderr == 'bad input'
+    
+    def test_stalled_ffmpeg_is_killed(self, tmp_path):
+        """Test that ffmpeg is killed once progress stops for stall_timeout seconds"""
+        import time
+        from spriter.ffprogress import run_with_progress
+        
+        cmd = self.fake_ffmpeg(tmp_path, "print('out_time_us=0\\nprogress=continue', flush=True)\ntime.sleep(30)")
+        start = time.monotonic()
+        with pytest.raises(subprocess.TimeoutExpired):
+            run_with_progress(cmd, stall_timeout=0.5, poll_interval=0.05)
+        assert time.monotonic() - start < 10
+    
+    @patch('spriter.main.run_with_progress')
+    @patch('subprocess.run')
+    def test_stall_timeout_option_fails_file(self, mock_run, mock_progress):
+        """Test that --stall-timeout routes ffmpeg through the progress runner and reports stalls"""
+        mock_run.return_value = MagicMock(returncode=0)
+        mock_progress.side_effect = subprocess.TimeoutExpired(['ffmpeg'], 5)
+        
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            video_path = Path(tmpdir) / "clip.mp4"
+            video_path.write_bytes(b'fake video content')
+            
+            result = runner.invoke(main, [str(video_path), '--stall-timeout', '5'])
+            
+            assert result.exit_code == 0
+            assert "made no progress for 5s" in result.output
+            assert mock_progress.call_args[0][2] == 5
+            assert not any(c[0][0][0] == 'ffmpeg' and '-i' in c[0][0] for c in mock_run.call_args_list)
+            # The single sheet only appears at the end, so a null copy output carries out_time
+            assert mock_progress.call_args[0][0][-7:] == ['-map', '0:v:0', '-c', 'copy', '-f', 'null', '-']
+    
+    def test_single_sheet_progress_total(self):
+        """Test that a single sheet's bar runs to the sample window, capped by the duration"""
+        from spriter.main import expected_output_seconds
+        from spriter.probe import VideoInfo
+        
+        assert expected_output_seconds(10, '6x6', False, 0, None) == 3.7
+        short = VideoInfo(duration=2.0, frame_count=None, width=None, height=None, frame_rate=None, codec=None, pix_fmt=None)
+        assert expected_output_seconds(10, '6x6', False, 0, short) == 2.0
+        assert expected_output_seconds(10, '6x6', True, 2, None) == 7.2
+
+
+class TestDiscovery:
+    
+    @staticmethod
+    def make_tree(root):
+        """A small library with nested folders, mixed-case extensions and non-videos"""
+        files = {
+            'a.mp4': 10, 'B.MOV': 2000, 'notes.txt': 5,
+            'takes/c.mpg': 500, 'takes/c_raw.mp4': 50,
+            'takes/old/d.mp4': 20, 'cache/e.mp4': 30
+        }
+        for name, size in files.items():
+            path = root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'x' * size)
+    
+    def test_scan_is_flat_by_default_and_recursive_on_request(self, tmp_path):
+        """Test that scanning lists each video once, in name order, recursing only when asked"""
+        from spriter.discovery import scan_directory
+        self.make_tree(tmp_path)
+        
+        assert [p.name for p in scan_directory(tmp_path)] == ['B.MOV', 'a.mp4']
+        assert [p.relative_to(tmp_path).as_posix() for p in scan_directory(tmp_path, recursive=True)] == [
+            'B.MOV', 'a.mp4', 'cache/e.mp4', 'takes/c.mpg', 'takes/c_raw.mp4', 'takes/old/d.mp4'
+        ]
+    
+    def test_include_exclude_and_size_filters(self, tmp_path):
+        """Test glob and size filters, including pruning excluded directories"""
+        from spriter.discovery import DiscoveryFilter, scan_directory
+        self.make_tree(tmp_path)
+        
+        def names(**kwargs):
+            found = scan_directory(tmp_path, recursive=True, file_filter=DiscoveryFilter(**kwargs))
+            return [p.relative_to(tmp_path).as_posix() for p in found]
+        
+        assert names(exclude=('cache', '*_RAW.mp4', 'takes/old')) == ['B.MOV', 'a.mp4', 'takes/c.mpg']
+        assert names(include=('takes/*',)) == ['takes/c.mpg', 'takes/c_raw.mp4', 'takes/old/d.mp4']
+        assert names(min_size=30, max_size=500) == ['cache/e.mp4', 'takes/c.mpg', 'takes/c_raw.mp4']
+    
+    def test_parse_size(self):
+        """Test byte sizes with binary unit suffixes"""
+        from spriter.discovery import parse_size
+        
+        assert parse_size('500') == 500
+        assert parse_size('64k') == 64 * 1024
+        assert parse_size('1.5M') == int(1.5 * 1024 ** 2)
+        assert parse_size('2GiB') == 2 * 1024 ** 3
+        with pytest.raises(ValueError):
+            parse_size('lots')
+    
+    @patch('spriter.main.process_video_file')
+    @patch('subprocess.run')
+    def test_file_list_from_stdin_and_at_file(self, mock_run, mock_process, tmp_path):
+        """Test that '-' and @list.txt feed paths to the batch, skipping comments and repeats"""
+        mock_run.return_value = MagicMock(returncode=0)
+        mock_process.return_value = True
+        self.make_tree(tmp_path)
+        listing = f"{tmp_path / 'a.mp4'}\n# a comment\n\n{tmp_path / 'takes/c.mpg'}\n{tmp_path / 'a.mp4'}\n"
+        runner = CliRunner()
+        
+        result = runner.invoke(main, ['-'], input=listing)
+        assert result.exit_code == 0
+        assert [c[0][0] for c in mock_process.call_args_list] == [tmp_path / 'a.mp4', tmp_path / 'takes/c.mpg']
+        assert "Found 2 video files in 'stdin'" in result.output
+        
+        mock_process.reset_mock()
+        list_file = tmp_path / "list.txt"
+        list_file.write_text(listing)
+        result = runner.invoke(main, [f'@{list_file}', '--jobs', '2', '--min-size', '100'])
+        assert result.exit_code == 0
+        assert [c[0][0] for c in mock_process.call_args_list] == [tmp_path / 'takes/c.mpg']
+        
+        result = runner.invoke(main, ['@missing-list.txt'])
+        assert result.exit_code != 0
+        assert "does not exist" in result.output
+
+
+class TestAtlas:
+    
+    def test_shelf_packing(self):
+        """Test that rects fill shelves tallest first and spill onto new pages"""
+        from spriter.atlas import pack_shelves
+        
+        placements, pages = pack_shelves([(4, 2), (4, 2), (3, 3), (4, 2)], (8, 6), padding=1)
+        # The 3x3 rect opens the first shelf; the rest follow in their original order
+        assert placements == [(0, 4, 0), (0, 0, 4), (0, 0, 0), (1, 0, 0)]
+        assert pages == 2
+        assert pack_shelves([], (8, 8)) == ([], 0)
+        with pytest.raises(ValueError):
+            pack_shelves([(9, 1)], (8, 8))
+    
+    def test_animation_names_are_unique(self):
+        """Test that clips sharing a file stem get numbered animation names"""
+        from spriter.atlas import animation_names
+        
+        names = animation_names([Path('a/walk.mp4'), Path('b/walk.mov'), Path('run.mp4')])
+        assert list(names.values()) == ['walk', 'walk_2', 'run']
+    
+    @patch('subprocess.Popen')
+    def test_atlas_packs_every_clip_with_sidecar(self, mock_popen, tmp_path):
+        """Test that each clip is decoded once and its frames are packed across pages with a sidecar"""
+        from PIL import Image
+        from spriter.atlas import build_atlas
+        
+        mock_popen.side_effect = [
+            TestRawPipeBackend.fake_ffmpeg([10, 20, 30], channels=4),
+            TestRawPipeBackend.fake_ffmpeg([40, 50, 60], channels=4)
+        ]
+        output = tmp_path / "atlas.png"
+        
+        pages, sidecar, failed = build_atlas([Path('walk.mp4'), Path('run.mp4')], output, 10, '4x2', 3,
+                                             page_size=(8, 4), padding=0)
+        
+        assert failed == {}
+        assert mock_popen.call_count == 2
+        assert [page.name for page in pages] == ['atlas_0.png', 'atlas_1.png']
+        data = json.loads(sidecar.read_text())
+        assert sidecar == tmp_path / "atlas.json"
+        assert [page['image'] for page in data['pages']] == ['atlas_0.png', 'atlas_1.png']
+        run = data['animations']['run']['frames']
+        assert [(frame['page'], frame['x'], frame['y']) for frame in run] == [(0, 4, 2), (1, 0, 0), (1, 4, 0)]
+        assert all((frame['w'], frame['h']) == (4, 2) for frame in run)
+        # Each rect holds that clip's frame; the rest of the page stays transparent
+        second = Image.open(pages[1])
+        assert second.mode == 'RGBA'
+        assert second.getpixel((0, 0)) == (50, 50, 50, 50)
+        assert second.getpixel((0, 3)) == (0, 0, 0, 0)
+    
+    def test_trim_frame_alpha_and_key_color(self):
+        """Test that trimming crops to visible pixels, keying out a background color first"""
+        from PIL import Image
+        from spriter.atlas import trim_frame
+        
+        frame = Image.new('RGBA', (8, 6), (0, 0, 0, 0))
+        frame.paste((255, 0, 0, 255), (2, 1, 5, 4))
+        trimmed, offset = trim_frame(frame)
+        assert trimmed.size == (3, 3) and offset == (2, 1)
+        
+        # Opaque green screen with slight compression noise around a 2x2 subject
+        screen = Image.new('RGBA', (8, 6), (4, 250, 6, 255))
+        screen.paste((200, 40, 40, 255), (5, 3, 7, 5))
+        trimmed, offset = trim_frame(screen, key_color=(0, 255, 0), tolerance=16)
+        assert trimmed.size == (2, 2) and offset == (5, 3)
+        assert trim_frame(screen, key_color=(0, 255, 0), tolerance=0)[0].size == (8, 6)
+        
+        empty, offset = trim_frame(Image.new('RGBA', (8, 6), (0, 0, 0, 0)))
+        assert empty.size == (1, 1) and offset == (0, 0)
+    
+    @patch('subprocess.Popen')
+    def test_trimmed_atlas_records_offsets(self, mock_popen, tmp_path):
+        """Test that keyed frames pack as trimmed rects with their offset and source size"""
+        from spriter.atlas import build_atlas
+        
+        # Two 4x2 RGBA frames: all key color except a single opaque pixel
+        key = bytes([0, 255, 0, 255])
+        first = key * 5 + bytes([9, 9, 9, 255]) + key * 2
+        second = bytes([9, 9, 9, 255]) + key * 7
+        process = TestRawPipeBackend.fake_ffmpeg([], channels=4)
+        process.stdout.write(first + second)
+        process.stdout.seek(0)
+        mock_popen.return_value = process
+        
+        _, sidecar, _ = build_atlas([Path('spark.mp4')], tmp_path / "atlas.png", 10, '4x2', 2,
+                                    page_size=(8, 8), trim=True, key_color=(0, 255, 0))
+        
+        data = json.loads(sidecar.read_text())
+        frames = data['animations']['spark']['frames']
+        assert data['trimmed'] is True
+        assert [(f['w'], f['h'], f['offset_x'], f['offset_y']) for f in frames] == [(1, 1, 1, 1), (1, 1, 0, 0)]
+        assert all((f['source_w'], f['source_h']) == (4, 2) for f in frames)
+    
+    def test_frame_hash_exact_and_perceptual(self):
+        """Test that exact hashes need identical pixels while perceptual hashes tolerate noise"""
+        from PIL import Image
+        from spriter.atlas import frame_hash
+        
+        gradient = Image.linear_gradient('L').resize((64, 64)).rotate(90).convert('RGBA')
+        noisy = gradient.copy()
+        noisy.putpixel((10, 10), (3, 3, 3, 255))
+        
+        assert frame_hash(gradient) == frame_hash(gradient.copy())
+        assert frame_hash(gradient) != frame_hash(noisy)
+        assert frame_hash(gradient, 'perceptual') == frame_hash(noisy, 'perceptual')
+        assert frame_hash(gradient, 'perceptual') != frame_hash(gradient.rotate(180), 'perceptual')
+        assert frame_hash(gradient, 'perceptual') != frame_hash(gradient.crop((0, 0, 32, 64)), 'perceptual')
+    
+    @patch('subprocess.Popen')
+    def test_dedup_shares_tiles_across_clips(self, mock_popen, tmp_path):
+        """Test that repeated frames are packed once and every repeat points at the shared rect"""
+        from spriter.atlas import build_atlas
+        
+        mock_popen.side_effect = [
+            TestRawPipeBackend.fake_ffmpeg([10, 10, 20], channels=4),
+            TestRawPipeBackend.fake_ffmpeg([20, 30], channels=4)
+        ]
+        
+        _, sidecar, _ = build_atlas([Path('idle.mp4'), Path('wave.mp4')], tmp_path / "atlas.png", 10, '4x2', 3,
+                                    page_size=(16, 16), dedup='exact')
+        
+        data = json.loads(sidecar.read_text())
+        idle = data['animations']['idle']['frames']
+        wave = data['animations']['wave']['frames']
+        assert data['tile_count'] == 3
+        assert [f['tile'] for f in idle + wave] == [0, 0, 1, 1, 2]
+        assert (idle[0]['x'], idle[0]['y']) == (idle[1]['x'], idle[1]['y'])
+        assert (idle[2]['x'], idle[2]['y']) == (wave[0]['x'], wave[0]['y'])
+    
+    @patch('subprocess.run')
+    def test_atlas_option_validation(self, mock_run, tmp_path):
+        """Test that --atlas rejects per-sheet options and --trim-key needs --trim"""
+        mock_run.return_value = MagicMock(returncode=0)
+        runner = CliRunner()
+        
+        result = runner.invoke(main, [str(tmp_path), '--atlas', '--loop'])
+        assert result.exit_code != 0
+        assert "--atlas only works" in result.output
+        
+        result = runner.invoke(main, [str(tmp_path), '--atlas', '--atlas-size', 'big'])
+        assert result.exit_code != 0
+        
+        result = runner.invoke(main, [str(tmp_path), '--atlas', '--trim-key', '#00ff00'])
+        assert result.exit_code != 0
+        assert "--trim-key only works with --trim" in result.output
+        
+        result = runner.invoke(main, [str(tmp_path), '--trim', '--trim-key', 'not-a-color'])
+        assert result.exit_code != 0
+
+
+class TestMetadata:
+    
+    def test_grid_metadata_and_texturepacker_layouts(self):
+        """Test row-major rects and times across pages, and TexturePacker documents without blank frames"""
+        from spriter.metadata import grid_metadata, texturepacker_document
+        
+        blank = [[[False, False], [False, False]], [[False, True], [True, True]]]
+        metadata = grid_metadata([Path('s_0.png'), Path('s_1.png')], Path('clips/walk.mp4'), 4, '8x6', '2x2', loop=True, blank=blank)
+        
+        frames = metadata['animations']['walk']['frames']
+        assert len(frames) == 8
+        assert (frames[3]['page'], frames[3]['x'], frames[3]['y'], frames[3]['w'], frames[3]['h']) == (0, 8, 6, 8, 6)
+        assert (frames[4]['page'], frames[4]['x'], frames[4]['y'], frames[4]['time']) == (1, 0, 0, 1.0)
+        assert metadata['loop'] is True and metadata['blank_frames'] == [5, 6, 7]
+        assert metadata['pages'][1] == {'image': 's_1.png', 'width': 16, 'height': 12}
+        
+        hashed = texturepacker_document(metadata, 1, 'hash')
+        assert list(hashed['frames']) == ['walk_0004']
+        assert hashed['frames']['walk_0004']['frame'] == {'x': 0, 'y': 0, 'w': 8, 'h': 6}
+        assert hashed['frames']['walk_0004']['duration'] == 250
+        assert hashed['meta']['image'] == 's_1.png'
+        assert hashed['meta']['frameTags'] == [{'name': 'walk', 'from': 0, 'to': 0, 'direction': 'forward'}]
+        
+        array = texturepacker_document(metadata, 0, 'array')
+        assert [frame['filename'] for frame in array['frames']] == ['walk_0000', 'walk_0001', 'walk_0002', 'walk_0003']
+        assert array['frames'][0]['trimmed'] is False
+    
+    def test_seek_timestamps_are_recorded(self):
+        """Test that explicit timestamps replace the k/fps frame times"""
+        from spriter.metadata import grid_metadata
+        
+        metadata = grid_metadata([Path('s.png')], Path('long.mp4'), 10, '4x4', '2x1', timestamps=[2.5, 7.5])
+        assert [frame['time'] for frame in metadata['animations']['long']['frames']] == [2.5, 7.5]
+    
+    @patch('subprocess.run')
+    def test_sidecars_written_next_to_sheet(self, mock_run, tmp_path):
+        """Test that a conversion writes the generic and TexturePacker sidecars, flagging blank tiles"""
+        from PIL import Image
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b'fake video content')
+        output = tmp_path / "sheet.png"
+        
+        def fake_ffmpeg(cmd, **kwargs):
+            if cmd[-1] == str(output):
+                # Three bright tiles and one black padding tile
+                sheet = Image.new('RGB', (8, 8), (200, 200, 200))
+                sheet.paste((0, 0, 0), (4, 4, 8, 8))
+                sheet.save(output)
+            return MagicMock(returncode=0)
+        mock_run.side_effect = fake_ffmpeg
+        
+        result = CliRunner().invoke(main, [str(video), '-o', str(output), '--size', '4x4', '--grid', '2x2',
+                                           '--metadata', 'json', '--metadata', 'texturepacker-hash'])
+        
+        assert result.exit_code == 0
+        data = json.loads((tmp_path / "sheet.json").read_text())
+        assert data['blank_frames'] == [3]
+        assert data['grid'] == '2x2' and data['loop'] is False
+        hashed = json.loads((tmp_path / "sheet.tp-hash.json").read_text())
+        assert len(hashed['frames']) == 3
+        
+        (tmp_path / "sheet.json").unlink()
+        result = CliRunner().invoke(main, [str(video), '-o', str(output), '--size', '4x4', '--grid', '2x2', '--metadata', 'none'])
+        assert result.exit_code == 0
+        assert not (tmp_path / "sheet.json").exists()
+
+
+class TestPalette:
+    
+    def test_shared_palette_and_transparency(self):
+        """Test that images share one palette of at most N colors and RGBA keeps 1-bit transparency"""
+        from PIL import Image
+        from spriter.palette import shared_palette, to_indexed
+        
+        gradient = Image.linear_gradient('L').resize((32, 32)).convert('RGB')
+        sprite = Image.new('RGBA', (32, 32), (0, 0, 0, 0))
+        sprite.paste((255, 0, 0, 255), (8, 8, 24, 24))
+        
+        colors = shared_palette([gradient, sprite], 8, transparent=True)
+        assert len(colors.getpalette()) // 3 <= 7
+        
+        indexed = to_indexed(sprite, colors, dither='none')
+        transparent = indexed.info['transparency']
+        assert indexed.mode == 'P'
+        assert indexed.getpixel((0, 0)) == transparent
+        assert indexed.getpixel((16, 16)) != transparent
+        assert indexed.convert('RGB').getpixel((16, 16))[0] > 200
+        assert len(to_indexed(gradient, colors).getcolors()) <= 7
+    
+    @patch('subprocess.run')
+    def test_tile_backend_writes_paletted_sheet(self, mock_run, tmp_path):
+        """Test that --palette adds palettegen/paletteuse after the tile filter"""
+        mock_run.return_value = MagicMock(returncode=0)
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b'fake video content')
+        output = tmp_path / "sheet.png"
+        output.write_bytes(b'fake png content')
+        
+        result = CliRunner().invoke(main, [str(video), '-o', str(output), '--palette', '16', '--dither', 'none', '--metadata', 'none'])
+        
+        assert result.exit_code == 0
+        args = mock_run.call_args_list[1][0][0]
+        vf = args[args.index('-vf') + 1]
+        assert vf.startswith('fps=10,scale=64x64,tile=6x6,split')
+        assert 'palettegen=max_colors=16:reserve_transparent=0' in vf
+        assert 'paletteuse=dither=none' in vf
+        
+        result = CliRunner().invoke(main, [str(video), '--palette', '1'])
+        assert result.exit_code != 0
+    
+    @patch('subprocess.Popen')
+    def test_atlas_pages_are_indexed(self, mock_popen, tmp_path):
+        """Test that atlas pages are written as paletted PNGs with transparent free space"""
+        from PIL import Image
+        from spriter.atlas import build_atlas
+        
+        mock_popen.return_value = TestRawPipeBackend.fake_ffmpeg([255, 128], channels=4)
+        
+        pages, _, _ = build_atlas([Path('walk.mp4')], tmp_path / "atlas.png", 10, '4x2', 2, page_size=(8, 8), padding=0, palette=4)
+        
+        page = Image.open(pages[0])
+        assert page.mode == 'P'
+        assert page.convert('RGBA').getpixel((0, 0)) == (255, 255, 255, 255)
+        assert page.convert('RGBA').getpixel((0, 7))[3] == 0
+    
+    @staticmethod
+    def plte(path):
+        """The raw PLTE chunk of a PNG file"""
+        data = Path(path).read_bytes()
+        start = data.index(b'PLTE')
+        return data[start + 4:start + 4 + int.from_bytes(data[start - 4:start], 'big')]
+    
+    @staticmethod
+    def fake_palettegen(cmd, **kwargs):
+        """A subprocess.run stand-in for the first pass: writes a 16x16 palettegen-style PNG"""
+        from PIL import Image
+        palette = Image.new('RGB', (16, 16))
+        palette.putdata([(10, 10, 10), (200, 200, 200), (90, 30, 30), (30, 90, 30)] + [(0, 0, 0)] * 252)
+        palette.save(cmd[-1])
+        return MagicMock(returncode=0)
+    
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_raw_pages_share_first_pass_palette(self, mock_popen, mock_run, tmp_path):
+        """Test that every paginated raw page is written with the same PLTE, from the first-pass palette"""
+        pytest.importorskip('numpy')
+        from PIL import Image
+        from spriter.rawpipe import build_raw_sheets
+        
+        mock_popen.return_value = TestRawPipeBackend.fake_ffmpeg([10, 200, 10, 200, 90, 30, 10, 200, 30])
+        mock_run.side_effect = self.fake_palettegen
+        
+        written = build_raw_sheets('clip.mp4', tmp_path / "sheet.png", 10, '4x2', '2x2', paginate=True, palette=4)
+        
+        assert len(written) == 3
+        assert all(Image.open(path).mode == 'P' for path in written)
+        assert {self.plte(path) for path in written} == {bytes([10, 10, 10, 200, 200, 200, 90, 30, 30, 30, 90, 30])}
+        first_pass = mock_run.call_args[0][0]
+        assert first_pass[first_pass.index('-skip_frame') + 1] == 'nokey'
+        assert 'palettegen=max_colors=4:reserve_transparent=0' in first_pass[first_pass.index('-vf') + 1]
+    
+    @patch('subprocess.run')
+    def test_tile_pages_use_first_pass_palette(self, mock_run, tmp_path):
+        """Test that paginated tile runs map every page onto one palette file instead of buffering for palettegen"""
+        from PIL import Image
+        from spriter.palette import load_palette
+        
+        palette_files = []
+        def fake_run(cmd, **kwargs):
+            if '-skip_frame' in cmd:
+                palette_files.append(cmd[-1])
+                return self.fake_palettegen(cmd)
+            if '-version' not in cmd:
+                # Stand in for paletteuse: map each page onto the palette input
+                colors = load_palette(cmd[cmd.index('-i') + 3], 4)
+                for page in range(2):
+                    Image.new('RGB', (128, 128), (page * 200, 10, 10)).quantize(palette=colors).save(cmd[-1].replace('%d', str(page)))
+            return MagicMock(returncode=0)
+        mock_run.side_effect = fake_run
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b'fake video content')
+        output = tmp_path / "sheet.png"
+        
+        result = CliRunner().invoke(main, [str(video), '-o', str(output), '--paginate', '--max-pages', '2', '--palette', '4',
+                                           '--metadata', 'none'])
+        
+        assert result.exit_code == 0
+        args = mock_run.call_args_list[-1][0][0]
+        assert '-vf' not in args
+        graph = args[args.index('-filter_complex') + 1]
+        assert graph.startswith('[0:v]fps=10,scale=64x64,tile=6x6[sheet_tiles];[sheet_tiles][1:v]paletteuse')
+        assert 'palettegen' not in graph
+        assert args[args.index('-i') + 3] == palette_files[0]
+        pages = sorted(tmp_path.glob('sheet_*.png'))
+        assert len(pages) == 2 and len({self.plte(page) for page in pages}) == 1
+        assert not Path(palette_files[0]).exists()